@@ -0,0 +1,100 @@
+"""Attach an editor's stdio to the Jovian bridge daemon.
+
+Neovim starts this instead of kernel_bridge.py when daemon mode is on. It
+starts the daemon if nothing listens on the socket yet, attaches to a
+session and relays JSON lines both ways; SIGINT becomes an interrupt command
+for the session's kernel. Only the standard library is imported, so
+(re)attaching costs an interpreter start and nothing more.
+"""
+
+import argparse
+import json
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+def default_socket_path():
+    base = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(base, f"jovian-{os.getuid()}.sock")
+
+
+def connect(path, timeout=0):
+    deadline = time.monotonic() + timeout
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            return sock
+        except OSError:
+            sock.close()
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+def start_daemon(path):
+    bridge = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel_bridge.py")
+    # Own session, so the daemon outlives this process and the editor
+    with open(path + ".log", "ab") as log:
+        subprocess.Popen(
+            [sys.executable, "-u", bridge, "--daemon", "--socket", path],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=log,
+            start_new_session=True,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", help="Daemon socket path")
+    parser.add_argument("--session", help="Kernel session to attach to")
+    parser.add_argument("--connection-file", help="Path to Jupyter connection file")
+    args = parser.parse_args()
+
+    path = args.socket or default_socket_path()
+    try:
+        sock = connect(path)
+    except OSError:
+        start_daemon(path)
+        sock = connect(path, timeout=30)
+
+    attach = {
+        "command": "attach",
+        "session": args.session or os.getcwd(),
+        "connection_file": args.connection_file,
+    }
+    sock.sendall((json.dumps(attach) + "\n").encode())
+
+    # Neovim interrupts by signalling its job; the kernel lives in the daemon
+    def on_interrupt(signum, frame):
+        sock.sendall(b'{"command": "interrupt"}\n')
+
+    signal.signal(signal.SIGINT, on_interrupt)
+
+    stdin_fd = sys.stdin.fileno()
+    stdout_fd = sys.stdout.fileno()
+    while True:
+        readable, _, _ = select.select([stdin_fd, sock], [], [])
+        if stdin_fd in readable:
+            data = os.read(stdin_fd, 1 << 16)
+            if not data:
+                # Editor went away: detach, the session keeps running
+                break
+            sock.sendall(data)
+        if sock in readable:
+            data = sock.recv(1 << 16)
+            if not data:
+                break
+            while data:
+                data = data[os.write(stdout_fd, data) :]
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,26 @@
 import argparse
+import ast
 import base64
+import collections
+import hashlib
+import heapq
 import json
 import os
 import queue
 import re
 import sys
-import threading
 import time
 
+import shutil
 import signal
+import socket
+import struct
+import symtable
+import tempfile
 import atexit
 
 try:
+    import zmq
     from jupyter_client.blocking.client import BlockingKernelClient
     from jupyter_client.manager import KernelManager
 except ImportError as e:
@@ -25,76 +34,1062 @@ except ImportError as e:
 
 
 # --- Protocol Utils ---
+# Version 1 writes one JSON document per line. Version 2 frames each message
+# as "@<bytes>:<json>" so the editor knows how much to wait for before it
+# decodes; it is used once the editor asks for it in "configure".
+PROTOCOL_VERSION = 2
+stdout_protocol = 1
+
+
+def negotiate_protocol(requested):
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return 1
+    return max(1, min(requested, PROTOCOL_VERSION))
+
+
+def encode_message(msg, version=1):
+    # ASCII-only JSON, so the length in characters is the length in bytes
+    data = json.dumps(msg)
+    if version >= 2:
+        return f"@{len(data)}:{data}"
+    return data + "\n"
+
+
 def send_json(msg):
-    sys.stdout.write(json.dumps(msg) + "\n")
+    sys.stdout.write(encode_message(msg, stdout_protocol))
     sys.stdout.flush()
 
 
+# --- Event Loop ---
+class EventLoop:
+    """Single-threaded poll loop over zmq sockets, file descriptors and timers.
+
+    Sleeps in zmq.Poller until a registered source is readable or the earliest
+    timer is due, so an idle bridge makes no periodic wakeups.
+    """
+
+    def __init__(self):
+        self.poller = zmq.Poller()
+        self.readers = {}  # zmq socket or fd -> callback
+        self.timers = []  # heap of [deadline, seq, callback]
+        self._seq = 0
+        self.running = False
+
+    def add_reader(self, source, callback):
+        self.readers[source] = callback
+        self.poller.register(source, zmq.POLLIN)
+
+    def remove_reader(self, source):
+        if self.readers.pop(source, None) is not None:
+            self.poller.unregister(source)
+
+    def call_later(self, delay, callback):
+        """Run callback after delay seconds. Returns a handle for cancel()."""
+        self._seq += 1
+        timer = [time.monotonic() + delay, self._seq, callback]
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        timer[2] = None
+
+    def run(self):
+        self.running = True
+        while self.running:
+            timeout = None
+            if self.timers:
+                timeout = max(0, (self.timers[0][0] - time.monotonic()) * 1000)
+            for source, _ in self.poller.poll(timeout):
+                callback = self.readers.get(source)
+                if callback:
+                    self.call(callback)
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                callback = heapq.heappop(self.timers)[2]
+                if callback:
+                    self.call(callback)
+
+    def stop(self):
+        self.running = False
+
+    def call(self, callback):
+        """Run callback now, reporting instead of raising its errors."""
+        try:
+            callback()
+        except Exception as e:
+            send_json({"type": "debug", "msg": f"Bridge handler failed: {e!r}"})
+
+
 # ANSI escape code pattern (compiled once)
 _ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
 
 
-def process_console_output(text):
-    # Simple terminal emulator for \r and \n to handle progress bars (tqdm)
+# \r and \b are the only in-line controls the console screen interprets
+_line_controls = re.compile(r"([\r\b])")
+
+
+class OutputBudget:
+    """Per-cell cap on the text output kept in memory.
+
+    Within budget every line is kept. Once the budget is exceeded the full log
+    is spilled to disk and screens only keep a head and a rolling tail.
+    """
+
+    def __init__(self, max_lines=None, max_bytes=None, spill_path=None):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self.spill = None
+        self.used_lines = 0
+        self.used_bytes = 0
+        self.screens = []
+
+    def new_screen(self):
+        screen = ConsoleScreen(self)
+        self.screens.append(screen)
+        return screen
+
+    def add_line(self, line):
+        """Account for a finished line. Returns True once over budget."""
+        self.used_lines += 1
+        self.used_bytes += len(line.encode("utf-8", "replace")) + 1
+        if self.spill is not None:
+            self.spill.write(line + "\n")
+            return True
+        over_lines = self.max_lines and self.used_lines > self.max_lines
+        over_bytes = self.max_bytes and self.used_bytes > self.max_bytes
+        if not (over_lines or over_bytes):
+            return False
+        self._start_spill(line)
+        return True
+
+    def _start_spill(self, line):
+        # Write out everything captured so far, then keep streaming to disk
+        if self.spill_path:
+            try:
+                self.spill = open(self.spill_path, "w", encoding="utf-8")
+            except OSError:
+                self.spill_path = None
+        if self.spill is None:
+            self.spill = open(os.devnull, "w")
+        for screen in self.screens:
+            for kept in screen.lines:
+                self.spill.write(kept + "\n")
+        self.spill.write(line + "\n")
+
+    def head_quota(self):
+        # Head lines left for a screen that goes over budget
+        used = sum(len(screen.lines) for screen in self.screens)
+        return max(0, (self.max_lines or used) // 2 - used + len(self.screens[-1].lines))
+
+    def close(self):
+        if self.spill is not None and not self.spill.closed:
+            self.spill.close()
+
+
+class ConsoleScreen:
+    """Incremental terminal emulator for \r, \n and \b (progress bars, tqdm).
+
+    Stream chunks are fed as they arrive, so carriage-return rewrites are
+    collapsed immediately and only the resulting lines are kept in memory.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.lines = []  # Finished lines (the head once over budget)
+        self.tail = None  # Rolling window of the latest lines once over budget
+        self.tail_bytes = 0
+        self.elided = 0
+        self._pieces = []  # Line being written, joined lazily
+        self._line_len = 0
+        self.col = 0
+        self._carry = ""  # Incomplete ANSI escape sequence from previous chunk
+
+    def feed(self, text):
+        if self._carry:
+            text = self._carry + text
+            self._carry = ""
+
+        # Hold back an escape sequence split across chunks
+        esc = text.rfind("\x1b")
+        if esc != -1 and len(text) - esc < 32 and not _ansi_escape.match(text, esc):
+            self._carry = text[esc:]
+            text = text[:esc]
+
+        # Strip ANSI codes first to avoid garbage in text block
+        text = _ansi_escape.sub("", text)
+
+        for i, segment in enumerate(text.split("\n")):
+            if i > 0:
+                self._newline()
+            if segment:
+                self._write(segment)
+
+    def _write(self, segment):
+        for token in _line_controls.split(segment):
+            if token == "\r":
+                self.col = 0
+            elif token == "\b":
+                self.col = max(0, self.col - 1)
+            elif token:
+                self._put(token)
+
+    def _put(self, s):
+        if self.col == self._line_len:
+            # Plain append (the common case) stays O(len(s))
+            self._pieces.append(s)
+            self._line_len += len(s)
+        else:
+            # Overwrite in place, padding if the cursor is past the end
+            line = "".join(self._pieces).ljust(self.col)
+            line = line[: self.col] + s + line[self.col + len(s) :]
+            self._pieces = [line]
+            self._line_len = len(line)
+        self.col += len(s)
+
+        # A single line longer than the whole budget is wrapped like a terminal would
+        if self.budget and self.budget.max_bytes and self._line_len > self.budget.max_bytes:
+            self._newline()
+
+    def _newline(self):
+        line = "".join(self._pieces)
+        self._pieces = []
+        self._line_len = 0
+        self.col = 0
+
+        if self.budget is None or not self.budget.add_line(line):
+            self.lines.append(line)
+            return
+
+        if self.tail is None:
+            self._start_tail()
+        max_tail_bytes = (self.budget.max_bytes or 0) // 2
+        # Clip huge lines so one of them cannot push the whole tail out (full text is in the log)
+        max_line = max(80, max_tail_bytes // 16)
+        if max_tail_bytes and len(line) > max_line:
+            line = line[:max_line] + " …"
+        self.tail.append(line)
+        self.tail_bytes += len(line) + 1
+        while len(self.tail) > self.tail_lines or (
+            max_tail_bytes and self.tail_bytes > max_tail_bytes and len(self.tail) > 1
+        ):
+            self.tail_bytes -= len(self.tail.popleft()) + 1
+            self.elided += 1
+
+    def _start_tail(self):
+        # Split what is kept so far into a head and the start of the rolling tail
+        budget = self.budget
+        self.tail_lines = max(1, (budget.max_lines or len(self.lines) or 2) // 2)
+        max_head_bytes = (budget.max_bytes or 0) // 2
+        head_count = 0
+        head_bytes = 0
+        for line in self.lines[: budget.head_quota()]:
+            head_bytes += len(line) + 1
+            if max_head_bytes and head_bytes > max_head_bytes:
+                break
+            head_count += 1
+        self.tail = collections.deque(self.lines[head_count:])
+        self.tail_bytes = sum(len(line) + 1 for line in self.tail)
+        del self.lines[head_count:]
+
+    def render(self):
+        """Return (head, tail). tail is None unless lines were elided in between."""
+        current = "".join(self._pieces)
+        if self.tail is None or not self.elided:
+            return "\n".join(self.lines + list(self.tail or []) + [current]), None
+        return "\n".join(self.lines), "\n".join(list(self.tail) + [current])
+
+
+def collapse_carriage_returns(text):
+    """Drop progress-bar rewrites that a terminal would overwrite anyway.
+
+    "a\rb\rc" on one line is reduced to "a\r" plus what the rewrites leave
+    on screen. Lines with escape codes or backspaces are sent unchanged.
+    """
+    if "\r" not in text:
+        return text
+    segments = text.split("\n")
+    for i, segment in enumerate(segments):
+        if segment.count("\r") < 2 or "\x1b" in segment or "\b" in segment:
+            continue
+        head, rest = segment.split("\r", 1)
+        line = ""
+        for piece in rest.split("\r"):
+            line = piece + line[len(piece) :]
+        segments[i] = head + "\r" + line
+    return "\n".join(segments)
+
+
+class StreamCoalescer:
+    """Batches stream text for Neovim.
+
+    Chunks are merged per stream name (keeping stdout/stderr order) until the
+    flush interval elapses or the batch grows past max_bytes, then sent as a
+    single stream_batch message. The interval is a timer on the event loop.
+    """
+
+    def __init__(self, loop, send=None, interval=0.03, max_bytes=64 * 1024):
+        self.loop = loop
+        self.send = send or send_json
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.chunks = []  # [[stream, [text, ...]], ...] in arrival order
+        self.size = 0
+        self.timer = None
+
+    def write(self, stream, text):
+        if self.chunks and self.chunks[-1][0] == stream:
+            self.chunks[-1][1].append(text)
+        else:
+            self.chunks.append([stream, [text]])
+        self.size += len(text)
+        if self.size >= self.max_bytes:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.loop.call_later(self.interval, self.flush)
+
+    def flush(self):
+        if self.timer is not None:
+            self.loop.cancel(self.timer)
+            self.timer = None
+        chunks = self.chunks
+        self.chunks = []
+        self.size = 0
+        if chunks:
+            self.send(
+                {
+                    "type": "stream_batch",
+                    "chunks": [
+                        {"stream": name, "text": collapse_carriage_returns("".join(texts))}
+                        for name, texts in chunks
+                    ],
+                }
+            )
+
+
+def png_size(data):
+    """Width and height from a PNG's IHDR chunk, or (None, None)."""
+    if len(data) >= 24 and data[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", data[16:24])
+    return None, None
+
+
+PREVIEW_INDEX_STEP = 256  # Lines between the offsets in a .md.idx
+PREVIEW_INDEX_MIN_LINES = 1000  # Smaller outputs are previewed whole
+
+
+def markdown_index(data):
+    """Sidecar index of markdown bytes, so a page can be read without the rest.
+
+    offsets[i] is the byte offset of line i * step and fences[i] the code
+    fence that line is inside of (its opening line), or None.
+    """
+    offsets, fences = [], []
+    pos, fence = 0, None
+    lines = data.splitlines(keepends=True)
+    for number, line in enumerate(lines):
+        if number % PREVIEW_INDEX_STEP == 0:
+            offsets.append(pos)
+            fences.append(fence)
+        pos += len(line)
+        if line.lstrip().startswith(b"```"):
+            fence = None if fence else line.rstrip().decode("utf-8", "replace")
+    return {
+        "lines": len(lines),
+        "bytes": len(data),
+        "step": PREVIEW_INDEX_STEP,
+        "offsets": offsets,
+        "fences": fences,
+    }
+
+
+def write_markdown(path, markdown):
+    """Write a cell's markdown output and, when it is large, its .md.idx."""
+    data = markdown.encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(data)
+    index_path = path + ".idx"
+    if data.count(b"\n") < PREVIEW_INDEX_MIN_LINES:
+        try:
+            os.remove(index_path)
+        except FileNotFoundError:
+            pass
+        return
+    tmp = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(markdown_index(data), f)
+    os.replace(tmp, index_path)
+
+
+def legacy_cache_owner(filename):
+    """Cell ID encoded in a pre-manifest cache filename, or None."""
+    if filename.endswith(".md"):
+        return filename[:-3]
+    if filename.endswith(".log"):
+        return filename[:-4]
+    if filename.endswith(".png"):
+        # ID_timestamp_counter.png, or the older ID_counter.png
+        match = re.match(r"^(.*)_\d+_\d+\.png$", filename) or re.match(
+            r"^(.*)_\d+\.png$", filename
+        )
+        if match:
+            return match.group(1)
+    return None
+
+
+class OutputStore:
+    """Content-addressed image blobs plus an index of each cell's outputs.
+
+    Layout of a notebook's cache dir:
+        index.jsonl        append-only log of {"op": "set", "cell", "files", "blobs",
+                           "telemetry"}
+                           and {"op": "drop", "cell"} records
+        blobs/<hash>.<ext> stored once and shared by every cell producing the bytes
+        <id>.md, <id>.log  per-cell files, listed under "files"
+        <id>.md.idx        line offsets of a large <id>.md (see markdown_index)
+
+    The replayed index is kept in memory and only records appended since the
+    last look (by the bridge or by Neovim) are read, so cleanup touches just
+    the cells that changed.
+    """
+
+    BLOB_DIR = "blobs"
+    INDEX = "index.jsonl"
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, self.INDEX)
+        self._reset()
+
+    def _reset(self, ino=None):
+        self.cells = {}
+        self.refs = collections.Counter()
+        self.records = 0
+        self._offset = 0
+        self._ino = ino
+
+    @classmethod
+    def blob_name(cls, digest, ext="png"):
+        return f"{cls.BLOB_DIR}/{digest[:16]}.{ext}"
+
+    def put(self, data, ext="png"):
+        """Store bytes, returning (name, digest). Known blobs are not rewritten."""
+        digest = hashlib.sha256(data).hexdigest()
+        name = self.blob_name(digest, ext)
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return name, digest
+
+    def record(self, cell_id, files, blobs, meta=None):
+        """Replace a cell's entry, dropping whatever its previous run left behind.
+
+        meta holds extra fields kept with the entry (e.g. "telemetry").
+        """
+        self._refresh()
+        old = self.cells.get(cell_id) or {}
+        entry = {"op": "set", "cell": cell_id, "files": files, "blobs": blobs}
+        entry.update(meta or {})
+        self._append([entry])
+        self._remove([f for f in old.get("files", []) if f not in files])
+        self._collect(old.get("blobs", []))
+
+    def drop(self, cell_ids):
+        self._refresh()
+        entries = [self.cells[c] for c in set(cell_ids) if c in self.cells]
+        if not entries:
+            return
+        self._append([{"op": "drop", "cell": e["cell"]} for e in entries])
+        for entry in entries:
+            self._remove(entry.get("files", []))
+        self._collect([b for e in entries for b in e.get("blobs", [])])
+
+    def purge(self, valid_ids):
+        """Drop every indexed cell that is not in valid_ids."""
+        self._refresh()
+        self.drop([c for c in self.cells if c not in valid_ids])
+
+    def _apply(self, rec):
+        cell_id = rec.get("cell")
+        old = self.cells.pop(cell_id, None)
+        if old:
+            self.refs.subtract(old.get("blobs", []))
+        if rec.get("op") == "set":
+            self.cells[cell_id] = rec
+            self.refs.update(rec.get("blobs", []))
+        self.records += 1
+
+    def _refresh(self):
+        # Replay records appended since the last look; a compacted (replaced)
+        # or truncated file is read from the start
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            if self._ino is None:
+                self._migrate()
+            return
+        if st.st_ino != self._ino or st.st_size < self._offset:
+            self._reset(st.st_ino)
+        if st.st_size == self._offset:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # a partially written record waits for next time
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, AttributeError):
+                pass
+        self._offset += end
+
+    def _append(self, records):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+        self._refresh()
+        if self.records > 2 * len(self.cells) + 64:
+            self._compact()
+
+    def _compact(self):
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.cells.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp, self.index_path)
+        cells = self.cells
+        self._reset(os.stat(self.index_path).st_ino)
+        for entry in cells.values():
+            self._apply(entry)
+        self._offset = os.path.getsize(self.index_path)
+
+    def _collect(self, candidates):
+        # Blobs are shared, so only delete the ones no remaining cell references
+        self._remove([b for b in set(candidates) if self.refs[b] <= 0])
+
+    def _remove(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+
+    def _migrate(self):
+        # Caches from before the index existed: import the old manifest.json, or
+        # recover owners from filenames, once
+        self._ino = 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        cells = {}
+        if "manifest.json" in names:
+            try:
+                path = os.path.join(self.root, "manifest.json")
+                with open(path, encoding="utf-8") as f:
+                    for cell_id, entry in (json.load(f).get("cells") or {}).items():
+                        cells[cell_id] = {"op": "set", "cell": cell_id, **entry}
+            except (OSError, ValueError, AttributeError):
+                pass
+        known = set(cells)
+        for name in names:
+            cell_id = legacy_cache_owner(name)
+            if cell_id and cell_id not in known:
+                entry = cells.setdefault(
+                    cell_id, {"op": "set", "cell": cell_id, "files": [], "blobs": []}
+                )
+                entry["files"].append(name)
+        if cells:
+            self._append(list(cells.values()))
+        self._remove(["manifest.json"])
+
+
+class MemoStore:
+    """Saved results of cells tagged `cache`, one directory per key.
+
+    Layout under the notebook's cache dir:
+        memo/<key>/values.pkl    names the cell defined (written by the kernel)
+        memo/<key>/output.md     the cell's markdown output
+        memo/<key>/images.json   {blob name: {width, height, hash}}
+        memo/<key>/<hash>.<ext>  links to those blobs, so a hit survives the
+                                 cell's later runs collecting them
+    An entry's mtime marks its last use; the least recently used entries go
+    once the total size passes the limit.
+    """
+
+    DIR = "memo"
+    VALUES = "values.pkl"
+
+    def __init__(self, root):
+        self.root = os.path.join(root, self.DIR)
+
+    def entry(self, key):
+        return os.path.join(self.root, key)
+
+    def save_output(self, key, markdown, images, store):
+        entry = self.entry(key)
+        os.makedirs(entry, exist_ok=True)
+        meta = {}
+        for name, image in images.items():
+            src = os.path.join(store.root, name)
+            dst = os.path.join(entry, os.path.basename(name))
+            if not os.path.exists(dst):
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copyfile(src, dst)
+            meta[name] = {k: image.get(k) for k in ("width", "height", "hash")}
+        with open(os.path.join(entry, "images.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        with open(os.path.join(entry, "output.md"), "w", encoding="utf-8") as f:
+            f.write(markdown)
+
+    def load_output(self, key, store):
+        """(markdown, images) of a saved run, images put back into store; None if incomplete."""
+        entry = self.entry(key)
+        images = {}
+        try:
+            with open(os.path.join(entry, "output.md"), encoding="utf-8") as f:
+                markdown = f.read()
+            with open(os.path.join(entry, "images.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            for name, image in meta.items():
+                ext = os.path.splitext(name)[1][1:] or "png"
+                with open(os.path.join(entry, os.path.basename(name)), "rb") as f:
+                    stored, _ = store.put(f.read(), ext)
+                images[stored] = dict(image, path=os.path.join(store.root, stored))
+        except (OSError, ValueError, AttributeError):
+            return None
+        return markdown, images
+
+    def discard(self, key):
+        shutil.rmtree(self.entry(key), ignore_errors=True)
+
+    def evict(self, max_bytes):
+        entries = []
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if not entry.is_dir():
+                        continue
+                    size = 0
+                    with os.scandir(entry.path) as files:
+                        for f in files:
+                            size += f.stat().st_size
+                    entries.append((entry.stat().st_mtime, size, entry.name))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= max_bytes:
+                break
+            self.discard(key)
+            total -= size
+
+
+RUNTIME_FILE = "jovian_runtime.py"
+FETCH_BATCH_BYTES = 4 * 1024 * 1024  # Raw bytes per file_data message
+FIGURE_DIR = os.path.join(tempfile.gettempdir(), "jovian-figures")  # Full-size renders
+
+
+# --- Cell Dependencies ---
+# Nested scopes; the globals they use are found through symtable
+SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+
+
+def top_level_nodes(tree):
+    """Nodes of the cell outside nested scopes."""
+    pending = list(tree.body)
+    while pending:
+        node = pending.pop()
+        yield node
+        if not isinstance(node, SCOPE_NODES):
+            pending.extend(ast.iter_child_nodes(node))
+
+
+COMPREHENSION_NODES = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
 
-    # Strip ANSI codes first to avoid garbage in text block
-    clean_text = _ansi_escape.sub("", text)
 
-    lines = [[]]
-    row = 0
-    col = 0
+def upstream_reads(tree):
+    """Names the cell loads before binding them: the values it takes from upstream.
 
-    for char in clean_text:  # Process clean_text, not original text
-        if char == "\n":
-            row += 1
-            col = 0
-            if len(lines) <= row:
-                lines.append([])
-        elif char == "\r":
-            col = 0
-        elif char == "\b":
-            col = max(0, col - 1)
+    Each statement is walked in execution order, so a name bound earlier in
+    the same statement (for targets, with ... as, :=, a recursive def) is not
+    a read. Names local to functions, classes, lambdas and comprehensions
+    neither count as reads nor bind globals.
+    """
+    reads, bound = set(), set()
+
+    def bind(name, scope):
+        (bound if scope is None else scope).add(name)
+
+    def visit(node, scope):
+        if isinstance(node, ast.Name):
+            if not isinstance(node.ctx, ast.Load):
+                bind(node.id, scope)
+            elif node.id not in bound and node.id not in (scope or ()):
+                reads.add(node.id)
+            return
+        if isinstance(node, ast.alias):
+            bind((node.asname or node.name).split(".")[0], scope)
+            return
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            # Decorators, defaults and bases run now; the body gets its own scope
+            body = node.body if isinstance(node.body, list) else [node.body]
+            inner = set(scope or ())
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, ast.arguments):
+                    for default in child.defaults + [d for d in child.kw_defaults if d]:
+                        visit(default, scope)
+                    for arg in ast.walk(child):
+                        if isinstance(arg, ast.arg):
+                            if arg.annotation:
+                                visit(arg.annotation, scope)
+                            inner.add(arg.arg)
+                elif child not in body:
+                    visit(child, scope)
+            if not isinstance(node, ast.Lambda):
+                bind(node.name, scope)
+                inner.add(node.name)
+            for child in body:
+                visit(child, inner)
+            return
+        if isinstance(node, COMPREHENSION_NODES):
+            inner = set(scope or ())
+            for generator in node.generators:
+                visit(generator.iter, inner if generator is not node.generators[0] else scope)
+                visit(generator.target, inner)
+                for condition in generator.ifs:
+                    visit(condition, inner)
+            elements = (node.key, node.value) if isinstance(node, ast.DictComp) else (node.elt,)
+            for child in elements:
+                visit(child, inner)
+            return
+        if isinstance(node, ast.ExceptHandler):
+            if node.type:
+                visit(node.type, scope)
+            if node.name:
+                bind(node.name, scope)
+            for child in node.body:
+                visit(child, scope)
+            return
+
+        if isinstance(node, ast.Assign):
+            children = [node.value, *node.targets]
+        elif isinstance(node, ast.AugAssign):
+            target = node.target
+            if isinstance(target, ast.Name):
+                target = ast.Name(target.id, ast.Load())
+            children = [target, node.value, node.target]
+        elif isinstance(node, ast.AnnAssign):
+            children = [node.annotation, node.value, node.target]
+        elif isinstance(node, (ast.For, ast.AsyncFor)):
+            children = [node.iter, node.target, *node.body, *node.orelse]
+        elif isinstance(node, ast.NamedExpr):
+            children = [node.value, node.target]
         else:
-            # Ensure line exists (handled by \n logic, but first line is pre-created)
-            current_line = lines[row]
-            # Pad if needed
-            while len(current_line) < col:
-                current_line.append(" ")
-
-            if len(current_line) == col:
-                current_line.append(char)
-            else:
-                current_line[col] = char
-            col += 1
+            children = ast.iter_child_nodes(node)
+        for child in children:
+            if child is not None:
+                visit(child, scope)
+        # match patterns bind their capture names after matching
+        for attr in ("name", "rest"):
+            if isinstance(node, getattr(ast, "pattern", ())) and getattr(node, attr, None):
+                bind(getattr(node, attr), scope)
 
-    # Join lines
-    return "\n".join(["".join(line) for line in lines])
+    for stmt in tree.body:
+        visit(stmt, None)
+    return reads
+
+
+# Magics that run their argument as code: name -> options that take a value
+CODE_MAGICS = {"time": "", "timeit": "nrp", "prun": "lsTD"}
+
+
+def strip_magic_options(arg, valued):
+    """The code of a magic's argument, without its leading -x options."""
+    while True:
+        match = re.match(r"\s*-([A-Za-z])(\S*)\s*", arg)
+        if not match:
+            return arg
+        arg = arg[match.end() :]
+        if match.group(1) in valued and not match.group(2):
+            arg = re.sub(r"^\S+\s*", "", arg, count=1)
+
+
+def magic_call(node):
+    """(method, string args) of a get_ipython().<method>(...) call, else None."""
+    if not (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and isinstance(node.func.value, ast.Call)
+        and isinstance(node.func.value.func, ast.Name)
+        and node.func.value.func.id == "get_ipython"
+    ):
+        return None
+    args = [arg.value for arg in node.args if isinstance(arg, ast.Constant)]
+    if len(args) != len(node.args) or not all(isinstance(arg, str) for arg in args):
+        return None
+    return node.func.attr, args
+
+
+class MagicCode(ast.NodeTransformer):
+    """Replaces magics that run code (%time, %%timeit, ...) with that code.
+
+    Any other IPython call left in the cell (magics, shell escapes) may read
+    anything, which sets opaque.
+    """
+
+    def __init__(self):
+        self.opaque = False
+
+    def code(self, call):
+        method, args = call
+        magic = args[0] if args else None
+        if method not in ("run_line_magic", "run_cell_magic") or magic not in CODE_MAGICS:
+            return None
+        line = strip_magic_options(args[1], CODE_MAGICS[magic]) if len(args) > 1 else ""
+        if method == "run_line_magic":
+            return line
+        # The line of %%timeit is its setup code
+        return (line if magic == "timeit" else "") + "\n" + (args[2] if len(args) > 2 else "")
+
+    def visit_Expr(self, node):
+        call = magic_call(node.value)
+        code = self.code(call) if call else None
+        if code is None:
+            return self.generic_visit(node)
+        try:
+            body = ast.parse(code).body
+        except SyntaxError:
+            self.opaque = True
+            return node
+        stmts = []
+        for stmt in body:
+            stmt = self.visit(stmt)
+            stmts.extend(stmt if isinstance(stmt, list) else [stmt])
+        return stmts or ast.Pass()
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        call = magic_call(node)
+        if call is None:
+            return node
+        code = self.code(call) if call[0] == "run_line_magic" else None
+        if code is not None:
+            try:
+                return ast.parse(code.strip(), mode="eval").body
+            except SyntaxError:
+                pass
+        self.opaque = True
+        return node
+
+
+_transformer = []  # IPython's TransformerManager once imported, or None
+
+
+def plain_python(code):
+    """(source, opaque) of the cell as the Python IPython would run.
+
+    Without IPython, magic and shell lines are blanked out and make the
+    cell opaque.
+    """
+    if not _transformer:
+        try:
+            from IPython.core.inputtransformer2 import TransformerManager
+
+            _transformer.append(TransformerManager())
+        except ImportError:
+            _transformer.append(None)
+    if _transformer[0] is None:
+        lines, opaque = [], False
+        for line in code.split("\n"):
+            stripped = line.lstrip()
+            if stripped.startswith(("%", "!")):
+                line = line[: len(line) - len(stripped)] + "pass"
+                opaque = True
+            lines.append(line)
+        return "\n".join(lines), opaque
+    return _transformer[0].transform_cell(code), False
+
+
+def cell_names(code):
+    """Global names a cell binds, uses, reads from upstream, imports and changes in place.
+
+    Magics are analysed as the code they run; a cell with other magics or
+    shell escapes is opaque (it may read any name). Returns None when the
+    cell cannot be parsed.
+    """
+    source, opaque = plain_python(code)
+    try:
+        magics = MagicCode()
+        tree = ast.fix_missing_locations(magics.visit(ast.parse(source)))
+        source = ast.unparse(tree)
+        table = symtable.symtable(source, "<cell>", "exec")
+    except (SyntaxError, ValueError):
+        return None
+    opaque = opaque or magics.opaque
+
+    defs, uses, imports = set(), set(), set()
+    for symbol in table.get_symbols():
+        name = symbol.get_name()
+        if symbol.is_imported():
+            imports.add(name)
+        if symbol.is_assigned() or symbol.is_imported():
+            defs.add(name)
+        if symbol.is_referenced():
+            uses.add(name)
+    # Globals read (or declared and assigned) in functions, classes and comprehensions
+    scopes = list(table.get_children())
+    while scopes:
+        scope = scopes.pop()
+        scopes.extend(scope.get_children())
+        for symbol in scope.get_symbols():
+            if symbol.is_global() and symbol.is_referenced():
+                uses.add(symbol.get_name())
+            if symbol.is_declared_global() and symbol.is_assigned():
+                defs.add(symbol.get_name())
+
+    # Only globals (symtable does not count "x += 1" as a reference)
+    reads = upstream_reads(tree) & (uses | defs)
+    uses |= reads
+
+    # Item/attribute assignment and bare method calls (df.x = ..., lst.append(...))
+    mutates = set()
+    for node in top_level_nodes(tree):
+        if isinstance(node, (ast.Assign, ast.Delete)):
+            targets = node.targets
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+            targets = [node.target]
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+            targets = [node.value.func]
+        else:
+            continue
+        for target in targets:
+            if not isinstance(target, (ast.Attribute, ast.Subscript)):
+                continue
+            while isinstance(target, (ast.Attribute, ast.Subscript)):
+                target = target.value
+            if isinstance(target, ast.Name):
+                mutates.add(target.id)
+    return {
+        "defs": defs,
+        "uses": uses,
+        "reads": reads,
+        "imports": imports,
+        "mutates": mutates,
+        "opaque": opaque,
+    }
+
+
+def plan_stale(cells, stale):
+    """Ids of the cells to re-run, in notebook order.
+
+    A cell re-runs if it is stale, or if it reads or rebinds a name that an
+    earlier re-run cell changed (rebinding restores what the cell set the
+    first time). Opaque cells (magics that may read anything) re-run once
+    anything changed. Cells that cannot be analysed re-run once anything
+    changed and then force every later cell to re-run.
+    """
+    stale = set(stale)
+    changed = set()
+    everything = False
+    modules = set()  # Names currently bound by an import
+    plan = []
+    for cell in cells:
+        names = cell_names(cell["code"])
+        if names is None:
+            run = everything or bool(changed) or cell["id"] in stale
+            everything = everything or run
+        else:
+            modules = (modules - names["defs"]) | names["imports"]
+            # Calling a module's functions does not change the module
+            writes = names["defs"] | (names["mutates"] - modules)
+            reads = names["uses"] | writes
+            run = (
+                everything
+                or cell["id"] in stale
+                or (names["opaque"] and bool(changed))
+                or not changed.isdisjoint(reads)
+            )
+            if run:
+                changed |= writes
+        if run:
+            plan.append(cell["id"])
+    return plan
+
+
+def previous_run_wall(entry):
+    """Wall time of the last real run behind an OutputStore entry, if known.
+
+    A cache hit's own wall is only the lookup, so it passes on the one
+    before it.
+    """
+    telemetry = (entry or {}).get("telemetry") or {}
+    if telemetry.get("cached"):
+        return telemetry.get("previous_wall")
+    return telemetry.get("wall")
 
 
 # --- Kernel Bridge ---
 class KernelBridge:
-    def __init__(self, connection_file=None):
+    def __init__(self, connection_file=None, loop=None):
         self.connection_file = connection_file
+        self.send = send_json  # Daemon sessions route messages to their clients
+        self.on_failed = None  # Called if the kernel never becomes ready
+        self.starting = None  # {"probes", "on_ready"} while waiting for the kernel
         self.km = None
         self.kc = None
         self.running = False
         self.execution_queue = queue.Queue()
         self.msg_queue = queue.Queue()
+        self.screen = None  # ConsoleScreen for the current run of text output
+        self.output_budget = None
+        self.output_limits = {"max_lines": 10000, "max_bytes": 4 * 1024 * 1024}
+        # A shared loop means a BridgeDaemon session; the daemon cleans up
+        # every session, so only a standalone bridge owns exit and signals
+        self.standalone = loop is None
+        self.loop = loop or EventLoop()
+        self.streams = StreamCoalescer(self.loop, lambda msg: self.send(msg))
+        self.shell_callbacks = {}  # msg_id -> (callback, timeout timer)
         self.current_cell_id = None
         self.current_msg_id = None
-        self.var_msg_id = None
+        self.current_request_id = None
+        self.requests = {}  # control msg_id -> request_id
+        self.control_ok = False
+        self.control_probe = None
+        self.current_memo = None  # {"names", "key", "started"} while a `cache` cell runs
+        self.current_telemetry = None  # Resource usage of the running cell
+        self.figure_slots = {}  # {token: queued item} of figures still being encoded
+        self.figure_options = {}  # Capture settings sent to the runtime
+        self.tracemalloc = False  # Whether the runtime traces allocation peaks
+        self.memo_max_bytes = 1024 * 1024 * 1024
 
         # Stream state tracking for tqdm fix
         self.last_stream_type = None
         self.last_stream_tail = None
         self.output_counter = 0
         self.save_dir = None
+        self.store = None
+        self.stores = {}  # cache dir -> OutputStore
+
+        # Warm pool: spare kernels started and injected ahead of a restart
+        self.spares = []  # {"km", "kc", "runtime_msg_id", "warm"}
+        self.pool_size = 0
+        self.pool_preload = []
 
     def start(self):
         # Register cleanup handlers
-        atexit.register(self.cleanup)
-        signal.signal(signal.SIGINT, self.cleanup_signal)
-        signal.signal(signal.SIGTERM, self.cleanup_signal)
+        if self.standalone:
+            atexit.register(self.cleanup)
+            signal.signal(signal.SIGINT, self.cleanup_signal)
+            signal.signal(signal.SIGTERM, self.cleanup_signal)
 
         if self.connection_file:
             # Connect to existing kernel
@@ -103,35 +1098,72 @@ class KernelBridge:
             self.kc.start_channels()
         else:
             # Start new local kernel
-            self.km = KernelManager(
-                kernel_cmd=[
-                    sys.executable,
-                    "-m",
-                    "ipykernel_launcher",
-                    "-f",
-                    "{connection_file}",
-                ]
-            )
-            self.km.start_kernel()
-            self.kc = self.km.client()
-            self.kc.start_channels()
+            self.km, self.kc = self._launch_kernel()
 
-        try:
-            self.kc.wait_for_ready(timeout=10)
-        except RuntimeError:
-            send_json({"type": "error", "msg": "Failed to connect to kernel"})
-            return
+        self._attach_kernel()
+        self._wait_until_ready(self._on_started, "Failed to connect to kernel")
 
+    def _on_started(self):
         self.running = True
-
         self._inject_runtime()
 
-        # Start a thread to poll IOPub messages
-        self.iopub_thread = threading.Thread(target=self._poll_iopub, daemon=True)
-        self.iopub_thread.start()
-
         # Signal readiness
-        send_json({"type": "ready"})
+        self.send({"type": "ready"})
+
+    def _wait_until_ready(self, on_ready, error, timeout=10):
+        """Call on_ready once the kernel is up, without blocking the loop.
+
+        Like wait_for_ready, kernel_info is sent until a reply shows up; an
+        IOPub message for it also proves the IOPub subscription is live.
+        """
+        deadline = time.monotonic() + timeout
+        starting = {"probes": set(), "on_ready": on_ready}
+        self.starting = starting
+
+        def probe():
+            if self.starting is not starting:
+                return
+            if time.monotonic() > deadline or (self.km and not self.km.is_alive()):
+                self.starting = None
+                self.send({"type": "error", "msg": error})
+                if self.on_failed:
+                    self.on_failed()
+                return
+            starting["probes"].add(self.kc.kernel_info())
+            self.loop.call_later(0.5, probe)
+
+        probe()
+
+    def _launch_kernel(self):
+        km = KernelManager(
+            kernel_cmd=[
+                sys.executable,
+                "-m",
+                "ipykernel_launcher",
+                "-f",
+                "{connection_file}",
+            ]
+        )
+        km.start_kernel()
+        kc = km.client()
+        kc.start_channels()
+        return km, kc
+
+    def _attach_kernel(self):
+        # All kernel channels are served by the event loop
+        self.loop.add_reader(self.kc.iopub_channel.socket, self._on_iopub)
+        self.loop.add_reader(self.kc.shell_channel.socket, self._on_shell)
+        self.loop.add_reader(self.kc.stdin_channel.socket, self._on_stdin)
+        self.loop.add_reader(self.kc.control_channel.socket, self._on_control)
+
+    def _detach_kernel(self):
+        for channel in (
+            self.kc.iopub_channel,
+            self.kc.shell_channel,
+            self.kc.stdin_channel,
+            self.kc.control_channel,
+        ):
+            self.loop.remove_reader(channel.socket)
 
     def cleanup_signal(self, signum, frame):
         # send_json({"type": "debug", "msg": f"Received signal {signum}, cleaning up..."})
@@ -140,6 +1172,10 @@ class KernelBridge:
 
     def cleanup(self):
         self.running = False
+        self.starting = None
+        for spare in self.spares:
+            spare["km"].shutdown_kernel(now=True)
+        self.spares = []
         if self.km:
             # Ensure we shut down the kernel process we started
             # send_json({"type": "debug", "msg": "Shutting down managed kernel..."})
@@ -147,95 +1183,196 @@ class KernelBridge:
         elif self.kc:
             self.kc.stop_channels()
 
+    def _runtime_script(self, preload=()):
+        # The runtime is sent as source rather than imported, so it also reaches
+        # kernels that cannot see this directory
+        runtime_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), RUNTIME_FILE)
+        with open(runtime_path, encoding="utf-8") as f:
+            source = f.read()
+        return f"""
+import sys as _sys, types as _types
+_m = _types.ModuleType("_jovian_runtime")
+exec(compile({source!r}, {runtime_path!r}, "exec"), _m.__dict__)
+_m.install(get_ipython(), _sys.modules.get("_jovian_runtime"))
+_m.telemetry["tracemalloc"] = {self.tracemalloc!r}
+_m.figures.update({self.figure_options!r})
+_m.preload({list(preload)!r})
+_sys.modules["_jovian_runtime"] = _m
+del _sys, _types, _m
+"""
+
     def _inject_runtime(self):
-        script = """
-import sys
-import io
-from IPython.display import display, Image
-
-# Global state
-_jovian_plot_mode = 'inline'
-_jovian_original_show = None
-
-def _jovian_show(*args, **kwargs):
-    global _jovian_plot_mode
-    global _jovian_original_show
-    
-    # Always capture and display the image for the preview pane
-    try:
-        import matplotlib.pyplot as plt
-        fig = plt.gcf()
-        # Only show if there's something to show
-        if fig.get_axes() or fig.lines or fig.patches or fig.texts:
-            buf = io.BytesIO()
-            fig.savefig(buf, format='png', bbox_inches='tight')
-            buf.seek(0)
-            display(Image(data=buf.getvalue(), format='png'))
-    except Exception:
-        pass
-
-    # Handle window mode
-    if _jovian_plot_mode == 'window':
-        if _jovian_original_show:
-            try:
-                # Call the original show function if it exists
-                return _jovian_original_show(*args, **kwargs)
-            except Exception:
-                # Fallback to default matplotlib show if original fails
-                try:
-                    import matplotlib.pyplot as plt
-                    # Avoid recursion if plt.show is self
-                    if plt.show != _jovian_show:
-                         return plt.show(*args, **kwargs)
-                except: pass
-        else:
-            # If no original show, try default matplotlib show
-            try:
-                import matplotlib.pyplot as plt
-                if plt.show != _jovian_show:
-                    return plt.show(*args, **kwargs)
-            except: pass
-        return
-    
-    # Inline mode cleanup
-    try:
-        import matplotlib.pyplot as plt
-        plt.close(fig)
-    except Exception:
-        pass
+        msg_id = self.kc.execute(self._runtime_script(), silent=True, store_history=False)
+        # Once the runtime is in place, find out whether control requests work
+        self._await_shell_reply(msg_id, lambda reply: self._probe_control(), timeout=30)
+
+    def _probe_control(self):
+        msg = self.kc.session.msg("jovian_request", {"op": "ping", "args": {}})
+        self.kc.control_channel.send(msg)
+        self.control_probe = msg["header"]["msg_id"]
+
+    def _request(self, op, args, request_id=None):
+        """Run a runtime op in the kernel; its bundle is sent back tagged with request_id."""
+        if self.control_ok:
+            msg = self.kc.session.msg("jovian_request", {"op": op, "args": args})
+            self.kc.control_channel.send(msg)
+            self.requests[msg["header"]["msg_id"]] = request_id
+            return
 
-def _jovian_patch_matplotlib(*args):
-    global _jovian_original_show
-    try:
-        import matplotlib.pyplot as plt
-        # Only patch if not already patched
-        if plt.show.__name__ != '_jovian_show':
-            _jovian_original_show = plt.show
-            plt.show = _jovian_show
-    except ImportError:
-        pass
-
-# Register hook to ensure patch is applied after imports
-try:
-    ip = get_ipython()
-    ip.events.register('post_run_cell', _jovian_patch_matplotlib)
-    del ip
-except:
-    pass
+        # Kernel without the control handler: evaluated after queued executions
+        self._shell_request(op, args, lambda bundle: self._send_bundle(bundle, request_id))
 
-# Try to patch immediately
-_jovian_patch_matplotlib()
+    def _shell_request(self, op, args, callback):
+        """Run a runtime op on the shell channel, in order with executions.
 
-# Ensure we are using a GUI backend (not inline) to support window mode
-try:
-    get_ipython().run_line_magic('matplotlib', 'auto')
-except:
-    pass
-"""
-        self.kc.execute(script, silent=True)
+        callback gets the op's bundle, or {} if the evaluation failed.
+        """
+        expr = f"__import__('_jovian_runtime').request_json({op!r}, {json.dumps(args)!r})"
+        msg_id = self.kc.execute(
+            "", silent=True, store_history=False, user_expressions={"bundle": expr}
+        )
+        self._await_shell_reply(msg_id, lambda reply: self._on_request_reply(reply, callback))
+
+    def _on_request_reply(self, reply, callback):
+        result = reply["content"].get("user_expressions", {}).get("bundle", {})
+        if result.get("status") != "ok":
+            callback({})
+            return
+        # text/plain is the repr of the JSON string returned by request_json
+        callback(json.loads(ast.literal_eval(result["data"]["text/plain"])))
+
+    def _send_bundle(self, data, request_id=None):
+        """Forward a jovian display bundle to Neovim. Returns False for other data."""
+        if "application/vnd.jovian.variables+json" in data:
+            var_data = data["application/vnd.jovian.variables+json"]
+            msg = {
+                "type": "variable_list",
+                "snapshot": var_data.get("snapshot"),
+                "base": var_data.get("base"),
+                "reset": var_data.get("reset", True),
+                "changed": var_data.get("changed", []),
+                "removed": var_data.get("removed", []),
+            }
+        elif "application/vnd.jovian.dataframe+json" in data:
+            df_data = data["application/vnd.jovian.dataframe+json"]
+            msg = dict(df_data, type="dataframe_data")
+        elif "application/vnd.jovian.peek+json" in data:
+            msg = {"type": "peek_data", "data": data["application/vnd.jovian.peek+json"]}
+        elif "application/vnd.jovian.profile+json" in data:
+            profile = data["application/vnd.jovian.profile+json"]
+            msg = dict(profile, type="profile_stats", cell_id=self.current_cell_id)
+        elif "application/vnd.jovian.figures+json" in data:
+            files = data["application/vnd.jovian.figures+json"]["files"]
+            for file in files:
+                if "data" in file:
+                    os.makedirs(FIGURE_DIR, exist_ok=True)
+                    file["path"] = os.path.join(FIGURE_DIR, file["name"])
+                    with open(file["path"], "wb") as f:
+                        f.write(base64.b64decode(file.pop("data")))
+            msg = {"type": "figure_files", "paths": [file["path"] for file in files]}
+        elif "application/vnd.jovian.clipboard+json" in data:
+            clip_data = data["application/vnd.jovian.clipboard+json"]
+            msg = {"type": "clipboard_data", "content": clip_data["content"]}
+        else:
+            return False
+        if request_id is not None:
+            msg["request_id"] = request_id
+        self.send(msg)
+        return True
+
+    # --- Warm pool ---
+    def _fill_pool(self):
+        # Only kernels the bridge launched itself can be swapped
+        if not self.km:
+            return
+        while len(self.spares) > self.pool_size:
+            self.spares.pop()["km"].shutdown_kernel(now=True)
+        while len(self.spares) < self.pool_size:
+            self._start_spare()
+
+    def _start_spare(self):
+        km, kc = self._launch_kernel()
+        # Requests queue on the sockets until the kernel is up, so nothing blocks here
+        script = self._runtime_script(self.pool_preload)
+        spare = {"km": km, "kc": kc, "warm": False}
+        spare["runtime_msg_id"] = kc.execute(script, silent=True, store_history=False)
+
+        def on_shell():
+            for msg in self._drain(kc.shell_channel):
+                if msg["parent_header"].get("msg_id") == spare["runtime_msg_id"]:
+                    spare["warm"] = True
+                    self.loop.remove_reader(kc.shell_channel.socket)
+
+        self.loop.add_reader(kc.shell_channel.socket, on_shell)
+        self.spares.append(spare)
+
+    def restart(self):
+        """Swap in a spare kernel (warm if possible) and shut the old one down."""
+        if not self.km:
+            self.send({"type": "error", "msg": "Cannot restart a kernel the bridge did not start"})
+            return
+        old_km, old_kc = self.km, self.kc
+        self._detach_kernel()
+        self._reset_kernel_state()
+
+        spare = next((s for s in self.spares if s["warm"]), None)
+        if spare is None and self.spares:
+            spare = self.spares[0]
+        if spare is not None:
+            self.spares.remove(spare)
+            self.loop.remove_reader(spare["kc"].shell_channel.socket)
+            self.km, self.kc = spare["km"], spare["kc"]
+            if spare["warm"]:
+                self._probe_control()
+            else:
+                self._await_shell_reply(
+                    spare["runtime_msg_id"], lambda reply: self._probe_control(), timeout=30
+                )
+        else:
+            # No pool: cold start, as on launch
+            self.km, self.kc = self._launch_kernel()
+        self._attach_kernel()
+        if spare is None:
+            self._wait_until_ready(self._on_started, "Failed to start kernel")
+        else:
+            self.send({"type": "ready"})
+
+        # The old kernel gets a moment to exit cleanly; the pool refills after that
+        old_kc.stop_channels()
+        old_km.request_shutdown()
+        self.loop.call_later(2, lambda: old_km.shutdown_kernel(now=True))
+        self.loop.call_later(2, self._fill_pool)
+
+    def _reset_kernel_state(self):
+        # Work addressed to the old kernel is dropped along with it
+        self.streams.flush()
+        if self.output_budget:
+            self.output_budget.close()
+        self.output_budget = None
+        self.screen = None
+        self.current_cell_id = None
+        self.current_msg_id = None
+        self.current_request_id = None
+        self.current_memo = None
+        self.output_counter = 0
+        with self.execution_queue.mutex:
+            self.execution_queue.queue.clear()
+        with self.msg_queue.mutex:
+            self.msg_queue.queue.clear()
+        for _, timer in self.shell_callbacks.values():
+            if timer is not None:
+                self.loop.cancel(timer)
+        self.shell_callbacks = {}
+        self.requests = {}
+        self.control_ok = False
+        self.control_probe = None
 
     def stop(self):
         self.running = False
+        self.starting = None
+        for spare in self.spares:
+            spare["km"].shutdown_kernel(now=True)
+        self.spares = []
         if self.kc:
             self.kc.stop_channels()
         if self.km:
@@ -251,7 +1388,7 @@ except:
                 # but it's not always supported or reliable via KC alone.
                 # Ideally, we should have a way to signal the kernel process.
                 # For now, we just log.
-                send_json(
+                self.send(
                     {
                         "type": "debug",
                         "msg": "Interrupting remote/existing kernel is best-effort",
@@ -260,17 +1397,75 @@ except:
                 # Attempt to send interrupt request if supported by protocol (rare)
                 pass
         except Exception as e:
-            send_json({"type": "error", "msg": f"Failed to interrupt: {e}"})
+            self.send({"type": "error", "msg": f"Failed to interrupt: {e}"})
 
-    def _poll_iopub(self):
-        while self.running:
+    def _drain(self, channel):
+        # Poller readiness is level-triggered, so take everything queued now
+        while True:
             try:
-                msg = self.kc.get_iopub_msg(timeout=0.1)
-                self._handle_iopub_msg(msg)
+                yield channel.get_msg(timeout=0)
             except queue.Empty:
+                return
+
+    def _on_iopub(self):
+        for msg in self._drain(self.kc.iopub_channel):
+            if self.starting is not None:
+                # Nothing but the readiness probes matters before the kernel is up
+                starting = self.starting
+                if msg["parent_header"].get("msg_id") in starting["probes"]:
+                    self.starting = None
+                    starting["on_ready"]()
                 continue
-            except Exception:
-                pass
+            try:
+                self._handle_iopub_msg(msg)
+            except Exception as e:
+                self.send({"type": "debug", "msg": f"Failed to handle IOPub message: {e!r}"})
+
+    def _on_shell(self):
+        # Replies nobody waits for (e.g. execute_reply) are dropped
+        for msg in self._drain(self.kc.shell_channel):
+            pending = self.shell_callbacks.pop(msg["parent_header"].get("msg_id"), None)
+            if pending:
+                callback, timer = pending
+                if timer is not None:
+                    self.loop.cancel(timer)
+                callback(msg)
+
+    def _on_stdin(self):
+        for msg in self._drain(self.kc.stdin_channel):
+            if msg["header"]["msg_type"] == "input_request":
+                # The kernel blocks in input() until input_reply arrives
+                self.streams.flush()
+                content = msg["content"]
+                self.send(
+                    {
+                        "type": "input_request",
+                        "prompt": content.get("prompt", ""),
+                        "password": content.get("password", False),
+                    }
+                )
+
+    def _on_control(self):
+        for msg in self._drain(self.kc.control_channel):
+            if msg["header"]["msg_type"] != "jovian_reply":
+                continue
+            parent_id = msg["parent_header"].get("msg_id")
+            if parent_id == self.control_probe:
+                self.control_ok = True
+            elif parent_id in self.requests:
+                request_id = self.requests.pop(parent_id)
+                self._send_bundle(msg["content"].get("data") or {}, request_id)
+
+    def _await_shell_reply(self, msg_id, callback, timeout=None):
+        timer = None
+        if timeout is not None:
+            timer = self.loop.call_later(
+                timeout, lambda: self.shell_callbacks.pop(msg_id, None)
+            )
+        self.shell_callbacks[msg_id] = (callback, timer)
+
+    def input_reply(self, value):
+        self.kc.input(value)
 
     def _handle_iopub_msg(self, msg):
         msg_type = msg["header"]["msg_type"]
@@ -296,11 +1491,11 @@ except:
                     if not self._ends_with_newline(self.last_stream_tail):
                         markdown_text = "\n" + text
 
-                # Forward to Neovim immediately for REPL
+                # Forward to Neovim for REPL (batched by the stream writer)
                 # We send the ORIGINAL text because shared.lua implements its own fix.
-                send_json({"type": "stream", "text": text, "stream": name})
+                self.streams.write(name, text)
 
-                self.msg_queue.put({"type": "text", "content": markdown_text})
+                self._queue_text(markdown_text)
 
                 # Update state
                 self.last_stream_type = name
@@ -310,57 +1505,43 @@ except:
             elif msg_type == "execute_result":
                 data = content["data"]
                 if "text/plain" in data:
-                    self.msg_queue.put(
-                        {"type": "text", "content": data["text/plain"] + "\n"}
-                    )
+                    self._queue_text(data["text/plain"] + "\n")
 
             elif msg_type == "display_data":
                 data = content["data"]
-                if "application/vnd.jovian.variables+json" in data:
-                    # Handle variables list
-                    var_data = data["application/vnd.jovian.variables+json"]
-                    send_json(
-                        {"type": "variable_list", "variables": var_data["variables"]}
-                    )
-                elif "application/vnd.jovian.dataframe+json" in data:
-                    # Handle dataframe data
-                    df_data = data["application/vnd.jovian.dataframe+json"]
-                    send_json(
-                        {
-                            "type": "dataframe_data",
-                            "name": df_data.get("name"),
-                            "columns": df_data.get("columns", []),
-                            "index": df_data.get("index", []),
-                            "data": df_data.get("data", []),
-                        }
-                    )
-                elif "application/vnd.jovian.peek+json" in data:
-                    # Handle peek data
-                    peek_data = data["application/vnd.jovian.peek+json"]
-                    send_json({"type": "peek_data", "data": peek_data})
-                elif "application/vnd.jovian.clipboard+json" in data:
-                    # Handle clipboard data
-                    clip_data = data["application/vnd.jovian.clipboard+json"]
-                    send_json(
-                        {"type": "clipboard_data", "content": clip_data["content"]}
-                    )
+                if "application/vnd.jovian.telemetry+json" in data:
+                    # Reported by the runtime's post_run_cell hook
+                    if self.current_telemetry is not None:
+                        self.current_telemetry.update(data["application/vnd.jovian.telemetry+json"])
+                    return
+                if self._send_bundle(data, self.current_request_id):
+                    # Jovian bundles (profile stats, ...) go straight to Neovim
+                    return
+                if "application/vnd.jovian.image-slot+json" in data:
+                    # Figure still being encoded; it takes this place once it arrives
+                    slot = {"type": "slot"}
+                    self.figure_slots[data["application/vnd.jovian.image-slot+json"]["token"]] = slot
+                    self._queue_item(slot)
+                elif "application/vnd.jovian.image+json" in data:
+                    image = data["application/vnd.jovian.image+json"]
+                    if "data" in image:
+                        # The runtime could not reach our filesystem
+                        saved = self._save_image(image.pop("data"), image["ext"])
+                        image = saved and {**saved, **image}
+                    # Otherwise already written to disk by the kernel runtime
+                    self._queue_image(image)
                 elif "image/png" in data:
-                    img_data = data["image/png"]
-                    # send_json({"type": "debug", "msg": f"Received image data, length: {len(img_data)}"})
-                    self.msg_queue.put({"type": "image", "data": img_data})
+                    # Decode on arrival so the base64 payload is not held until idle
+                    self._queue_image(self._save_image(data["image/png"]))
                 elif "text/plain" in data:
-                    self.msg_queue.put(
-                        {"type": "text", "content": data["text/plain"] + "\n"}
-                    )
+                    self._queue_text(data["text/plain"] + "\n")
 
             elif msg_type == "error":
                 # Forward error to REPL
                 error_text = "\n".join(content["traceback"])
-                send_json(
-                    {"type": "stream", "text": error_text + "\n", "stream": "stderr"}
-                )
+                self.streams.write("stderr", error_text + "\n")
 
-                self.msg_queue.put(
+                self._queue_item(
                     {
                         "type": "error",
                         "ename": content["ename"],
@@ -373,47 +1554,13 @@ except:
                 if content["execution_state"] == "idle":
                     self._finalize_execution()
 
-        elif self.var_msg_id and parent_id == self.var_msg_id:
-            if msg_type == "display_data":
-                data = content["data"]
-                if "application/vnd.jovian.variables+json" in data:
-                    var_data = data["application/vnd.jovian.variables+json"]
-                    send_json(
-                        {"type": "variable_list", "variables": var_data["variables"]}
-                    )
-                elif "application/vnd.jovian.dataframe+json" in data:
-                    df_data = data["application/vnd.jovian.dataframe+json"]
-                    send_json(
-                        {
-                            "type": "dataframe_data",
-                            "name": df_data.get("name"),
-                            "columns": df_data.get("columns", []),
-                            "index": df_data.get("index", []),
-                            "data": df_data.get("data", []),
-                        }
-                    )
-                elif "application/vnd.jovian.peek+json" in data:
-                    peek_data = data["application/vnd.jovian.peek+json"]
-                    send_json({"type": "peek_data", "data": peek_data})
-                elif "application/vnd.jovian.clipboard+json" in data:
-                    clip_data = data["application/vnd.jovian.clipboard+json"]
-                    send_json(
-                        {"type": "clipboard_data", "content": clip_data["content"]}
-                    )
-
-            elif msg_type == "stream":
-                # For variables, we might not want to forward stdout/stderr to REPL to avoid noise,
-                # but if there's an error it's good to know.
-                pass
-
-            elif msg_type == "error":
-                # If variable retrieval fails, we might want to know
-                pass
-
     def _finalize_execution(self):
         if not self.current_cell_id:
             return
 
+        # Pending REPL text must reach Neovim before result_ready
+        self.streams.flush()
+
         # Process accumulated messages
         output_md_lines = []
         images = {}
@@ -427,76 +1574,31 @@ except:
             md_filename = f"{self.current_cell_id}.md"
             md_path = os.path.join(save_dir, md_filename)
 
-            pending_text = []
-
             while not self.msg_queue.empty():
                 item = self.msg_queue.get()
 
                 if item["type"] == "text":
-                    pending_text.append(item["content"])
-                    continue
-
-                # Flush pending text before processing other items
-                if pending_text:
-                    full_text = "".join(pending_text)
-                    processed_text = process_console_output(full_text)
-                    if processed_text.strip():
-                        output_md_lines.append("```text")
-                        output_md_lines.append(processed_text.rstrip())
-                        output_md_lines.append("```")
-                        output_md_lines.append("")
-                    pending_text = []
-
-                if item["type"] == "image":
-                    img_data_b64 = item["data"]
-                    if not img_data_b64:
-                        # send_json({"type": "debug", "msg": "Skipping empty image data"})
-                        continue
-
-                    # Clean up old images for this cell before first write
-                    if self.output_counter == 0:
-                        try:
-                            import glob
-
-                            pattern = os.path.join(
-                                save_dir, f"{self.current_cell_id}_*.png"
-                            )
-                            for old_file in glob.glob(pattern):
-                                try:
-                                    os.remove(old_file)
-                                except:
-                                    pass
-                        except:
-                            pass
-
-                    img_filename = f"{self.current_cell_id}_{int(time.time())}_{self.output_counter:02d}.png"
-                    img_path = os.path.join(save_dir, img_filename)
-
-                    try:
-                        decoded_data = base64.b64decode(img_data_b64)
-                        if len(decoded_data) == 0:
-                            # send_json({"type": "debug", "msg": "Image data decoded to empty bytes"})
-                            continue
-
-                        with open(img_path, "wb") as f:
-                            f.write(decoded_data)
-
-                        images[img_filename] = img_data_b64
-                        output_md_lines.append(f"![Result]({img_filename})")
-                        output_md_lines.append("")
-                        self.output_counter += 1
-
-                        send_json(
-                            {
-                                "type": "image_saved",
-                                "path": os.path.abspath(img_path),
-                                "cell_id": self.current_cell_id,
-                            }
-                        )
-                    except Exception as e:
-                        send_json(
-                            {"type": "error", "msg": f"Failed to save image: {e}"}
+                    head, tail = item["screen"].render()
+                    self._append_text_block(output_md_lines, head)
+                    if tail is not None:
+                        spill_path = self.output_budget.spill_path
+                        output_md_lines.append(
+                            f"> *{item['screen'].elided} lines elided"
+                            + (f", full log at `{spill_path}`*" if spill_path else "*")
                         )
+                        output_md_lines.append("")
+                        self._append_text_block(output_md_lines, tail)
+
+                elif item["type"] == "image":
+                    img_filename = OutputStore.blob_name(item["hash"], item.get("ext", "png"))
+                    images[img_filename] = {
+                        "path": item["path"],
+                        "width": item.get("width"),
+                        "height": item.get("height"),
+                        "hash": item.get("hash"),
+                    }
+                    output_md_lines.append(f"![Result]({img_filename})")
+                    output_md_lines.append("")
 
                 elif item["type"] == "error":
                     error_info = {
@@ -531,23 +1633,33 @@ except:
                     output_md_lines.append("\n".join(clean_traceback))
                     output_md_lines.append("```")
 
-            # Flush remaining text
-            if pending_text:
-                full_text = "".join(pending_text)
-                processed_text = process_console_output(full_text)
-                if processed_text.strip():
-                    output_md_lines.append("```text")
-                    output_md_lines.append(processed_text.rstrip())
-                    output_md_lines.append("```")
-                    output_md_lines.append("")
+            if self.output_budget:
+                self.output_budget.close()
+
+            # Record what this run produced; the previous run's leftovers go
+            if self.store is None:
+                self.store = self._output_store(save_dir)
+            telemetry = self.current_telemetry or {}
+            previous = previous_run_wall(self.store.cells.get(self.current_cell_id))
+            if previous is not None and "wall" in telemetry:
+                telemetry["previous_wall"] = previous
+            self.store.record(
+                self.current_cell_id,
+                [
+                    md_filename,
+                    f"{md_filename}.idx",
+                    f"{self.current_cell_id}.log",
+                    f"{self.current_cell_id}.prof",
+                ],
+                list(dict.fromkeys(images)),
+                {"telemetry": telemetry},
+            )
 
             # Write Markdown file
-            with open(md_path, "w", encoding="utf-8") as f:
-                f.write(f"# Output: {self.current_cell_id}\n\n")
-                if not output_md_lines:
-                    f.write("*(No output)*\n")
-                else:
-                    f.write("\n".join(output_md_lines))
+            markdown = f"# Output: {self.current_cell_id}\n\n" + (
+                "\n".join(output_md_lines) if output_md_lines else "*(No output)*\n"
+            )
+            write_markdown(md_path, markdown)
 
             # Send result_ready
             msg = {
@@ -556,23 +1668,110 @@ except:
                 "file": os.path.abspath(md_path),
                 "status": "error" if error_info else "ok",
                 "images": images,
+                "telemetry": telemetry,
             }
             if error_info:
                 msg["error"] = error_info
+            if self.current_request_id is not None:
+                msg["request_id"] = self.current_request_id
+
+            self.send(msg)
 
-            send_json(msg)
+            if self.current_memo and self.current_memo.get("key") and not error_info:
+                self._save_memo(markdown, images)
 
         except Exception:
             pass
 
+        self._end_execution()
+
+    def _end_execution(self):
         # Reset state
+        self.output_budget = None
+        self.screen = None
         self.current_cell_id = None
         self.current_msg_id = None
+        self.current_request_id = None
+        self.current_memo = None
+        self.current_telemetry = None
         self.output_counter = 0
 
         # Check for pending executions
         self._process_next_in_queue()
 
+    # --- Memoized cells ---
+    def _on_memo_lookup(self, code, bundle):
+        if self.current_memo is None:
+            return  # The kernel went away meanwhile
+        memo = bundle.get("application/vnd.jovian.memo+json") or {}
+        if memo.get("hit") and self._finish_cached(memo["key"]):
+            return
+        self.current_memo["key"] = memo.get("key")
+        self.current_msg_id = self.kc.execute(code)
+
+    def _finish_cached(self, key):
+        """Answer the current cell with a saved run's output; its values are already restored."""
+        save_dir = self.save_dir or os.getcwd()
+        store = self._output_store(save_dir)
+        saved = MemoStore(save_dir).load_output(key, store)
+        if saved is None:
+            return False
+        markdown, images = saved
+
+        if self.output_budget:
+            self.output_budget.close()
+        md_filename = f"{self.current_cell_id}.md"
+        md_path = os.path.join(save_dir, md_filename)
+        # The hit's wall is the lookup; previous_wall keeps the last real run's
+        telemetry = dict(self.current_telemetry or {})
+        telemetry["cached"] = True
+        telemetry["wall"] = time.monotonic() - self.current_memo["started"]
+        previous = previous_run_wall(store.cells.get(self.current_cell_id))
+        if previous is not None:
+            telemetry["previous_wall"] = previous
+        store.record(
+            self.current_cell_id,
+            [md_filename, f"{md_filename}.idx"],
+            list(images),
+            {"telemetry": telemetry},
+        )
+        write_markdown(md_path, markdown)
+
+        msg = {
+            "type": "result_ready",
+            "cell_id": self.current_cell_id,
+            "file": os.path.abspath(md_path),
+            "status": "ok",
+            "images": images,
+            "cached": True,
+            "telemetry": telemetry,
+        }
+        if self.current_request_id is not None:
+            msg["request_id"] = self.current_request_id
+        self.send(msg)
+        self._end_execution()
+        return True
+
+    def _save_memo(self, markdown, images):
+        memo = self.current_memo
+        memos = MemoStore(self.save_dir or os.getcwd())
+        try:
+            memos.save_output(memo["key"], markdown, images, self.store)
+        except OSError:
+            memos.discard(memo["key"])
+            return
+
+        def on_saved(bundle):
+            result = bundle.get("application/vnd.jovian.memo+json") or {}
+            if not result.get("saved"):
+                # Something the cell defined cannot be pickled
+                memos.discard(memo["key"])
+            memos.evict(self.memo_max_bytes)
+
+        # Queued ahead of the next cell, so the values are the ones this run left
+        args = {"dir": memos.root, "key": memo["key"], "names": memo["names"]}
+        self._shell_request("memo_save", args, on_saved)
+
     def _process_next_in_queue(self):
         if not self.execution_queue.empty():
             next_cmd = self.execution_queue.get()
@@ -581,14 +1780,36 @@ except:
                 next_cmd["cell_id"],
                 next_cmd.get("file_dir"),
                 next_cmd.get("cwd"),
+                next_cmd.get("request_id"),
+                next_cmd.get("cache", False),
+                next_cmd.get("profile"),
+                next_cmd.get("queued_at"),
             )
 
-    def _do_execute(self, code, cell_id, file_dir=None, cwd=None):
+    def _do_execute(
+        self,
+        code,
+        cell_id,
+        file_dir=None,
+        cwd=None,
+        request_id=None,
+        cache=False,
+        profile=None,
+        queued_at=None,
+    ):
         self.current_cell_id = cell_id
+        # Time spent behind earlier cells; the runtime adds its own measurements
+        self.current_telemetry = {
+            "queue_wait": time.monotonic() - queued_at if queued_at is not None else 0.0
+        }
+        self.current_request_id = request_id
         self.save_dir = file_dir
 
         # Notify execution started
-        send_json({"type": "execution_started", "cell_id": cell_id, "code": code})
+        msg = {"type": "execution_started", "cell_id": cell_id, "code": code}
+        if request_id is not None:
+            msg["request_id"] = request_id
+        self.send(msg)
 
         # Switch kernel CWD if provided
         if cwd:
@@ -599,9 +1820,136 @@ except:
         # Clear queue
         with self.msg_queue.mutex:
             self.msg_queue.queue.clear()
+        self.figure_slots = {}
+        self.screen = None
+
+        # Images go to the notebook's blob store; the previous run's entry is
+        # replaced when this one is recorded
+        self.store = self._output_store(file_dir or os.getcwd())
+        # Only a kernel we launched is known to share our filesystem
+        blob_dir = (
+            os.path.join(self.store.root, OutputStore.BLOB_DIR) if self.km else None
+        )
+        self.kc.execute(
+            f"__import__('_jovian_runtime').output.update(blob_dir={blob_dir!r})",
+            silent=True,
+            store_history=False,
+        )
+
+        # Fresh output budget; a log spilled by a previous run is stale now
+        spill_path = os.path.join(file_dir or os.getcwd(), f"{cell_id}.log")
+        try:
+            os.remove(spill_path)
+        except OSError:
+            pass
+        self.output_budget = OutputBudget(
+            self.output_limits.get("max_lines"),
+            self.output_limits.get("max_bytes"),
+            spill_path,
+        )
+
+        if profile is not None:
+            # The runtime runs the cell under cProfile; the .prof file is only
+            # useful where Neovim can reach it
+            prof_path = (
+                os.path.join(os.path.abspath(file_dir), f"{cell_id}.prof")
+                if file_dir and self.km
+                else None
+            )
+            runner = (
+                f"__import__('_jovian_runtime').profile_run("
+                f"{code!r}, {prof_path!r}, {profile.get('sample_ms', 5)!r})"
+            )
+            self.current_msg_id = self.kc.execute(runner)
+            return
+
+        # `cache` cells first look for a saved run with the same code and inputs;
+        # only a kernel we launched shares the memo directory with us
+        names = cell_names(code) if cache and self.km else None
+        # An opaque cell's inputs cannot be hashed, so it always runs
+        if names is not None and not names["opaque"]:
+            memos = MemoStore(file_dir or os.getcwd())
+            self.current_memo = {
+                "names": sorted(names["defs"] | names["mutates"]),
+                "key": None,
+                "started": time.monotonic(),
+            }
+            args = {
+                "dir": memos.root,
+                "code_hash": hashlib.sha256(f"{cell_id}\0{code}".encode()).hexdigest(),
+                "uses": sorted(names["reads"]),
+            }
+            self._shell_request(
+                "memo_lookup", args, lambda bundle: self._on_memo_lookup(code, bundle)
+            )
+            return
 
         self.current_msg_id = self.kc.execute(code)
 
+    def _queue_text(self, text):
+        # Consecutive text output shares one screen so \r rewrites collapse on arrival
+        if self.screen is None:
+            if self.output_budget is None:
+                self.output_budget = OutputBudget()
+            self.screen = self.output_budget.new_screen()
+            self.msg_queue.put({"type": "text", "screen": self.screen})
+        self.screen.feed(text)
+
+    def _append_text_block(self, output_md_lines, text):
+        if text.strip():
+            output_md_lines.append("```text")
+            output_md_lines.append(text.rstrip())
+            output_md_lines.append("```")
+            output_md_lines.append("")
+
+    def _output_store(self, cache_dir):
+        root = os.path.abspath(cache_dir)
+        if root not in self.stores:
+            self.stores[root] = OutputStore(root)
+        return self.stores[root]
+
+    def _save_image(self, img_data_b64, ext="png"):
+        try:
+            data = base64.b64decode(img_data_b64)
+            if not data:
+                return None
+            if self.store is None:
+                self.store = self._output_store(self.save_dir or os.getcwd())
+            name, digest = self.store.put(data, ext)
+            width, height = png_size(data)
+            return {
+                "path": os.path.join(self.store.root, name),
+                "width": width,
+                "height": height,
+                "hash": digest,
+                "ext": ext,
+            }
+        except Exception as e:
+            self.send({"type": "error", "msg": f"Failed to save image: {e}"})
+            return None
+
+    def _queue_image(self, image):
+        if not image or not image.get("path") or not image.get("hash"):
+            return
+        self.output_counter += 1
+        slot = self.figure_slots.pop(image.get("token"), None)
+        self.send(
+            {
+                "type": "image_saved",
+                "path": image["path"],
+                "cell_id": self.current_cell_id,
+            }
+        )
+        if slot is not None:
+            slot.update(image, type="image")
+        else:
+            self._queue_item({"type": "image", **image})
+
+    def _queue_item(self, item):
+        # Any non-text output closes the current text block
+        self.screen = None
+        self.msg_queue.put(item)
+
     def _ends_with_newline(self, text):
         if not text:
             return False
@@ -612,217 +1960,216 @@ except:
             return False
         return clean_text.endswith("\n")
 
-    def execute_code(self, code, cell_id, file_dir=None, cwd=None):
+    def execute_code(
+        self,
+        code,
+        cell_id,
+        file_dir=None,
+        cwd=None,
+        request_id=None,
+        cache=False,
+        profile=None,
+    ):
         if self.current_cell_id is not None:
             self.execution_queue.put(
-                {"code": code, "cell_id": cell_id, "file_dir": file_dir, "cwd": cwd}
+                {
+                    "code": code,
+                    "cell_id": cell_id,
+                    "file_dir": file_dir,
+                    "cwd": cwd,
+                    "request_id": request_id,
+                    "cache": cache,
+                    "profile": profile,
+                    "queued_at": time.monotonic(),
+                }
             )
         else:
-            self._do_execute(code, cell_id, file_dir, cwd)
+            self._do_execute(code, cell_id, file_dir, cwd, request_id, cache, profile)
 
-    def get_variables(self):
-        script = """
-import json
-import types
-import sys
-from IPython.display import display
+    def get_variables(self, snapshot=None, request_id=None):
+        # snapshot: the last one Neovim applied; the reply is a diff against it
+        self._request("variables", {"snapshot": snapshot}, request_id)
 
-def _jovian_get_variables():
-    try:
-        var_list = []
-        ns = globals()
-        for name, value in list(ns.items()):
-            if name.startswith("_") or isinstance(value, (types.ModuleType, types.FunctionType, type)): continue
-            if name in ['In', 'Out', 'exit', 'quit', 'get_ipython', '_jovian_get_variables']: continue
-            
-            type_name = type(value).__name__
-            info = str(value)
-            info = info.replace("\\n", " ")
-            if len(info) > 200: info = info[:197] + "..."
-
-            if hasattr(value, 'shape'):
-                shape_str = str(value.shape).replace(" ", "")
-                if hasattr(value, 'dtype'):
-                    info = f"{shape_str} | {value.dtype}"
-                else:
-                    info = f"{shape_str} | {type_name}"
-            elif isinstance(value, (list, dict, set, tuple)):
-                info = f"len: {len(value)}"
-            var_list.append({"name": name, "type": type_name, "info": info})
-            
-        var_list.sort(key=lambda x: x['name'])
-        display({"application/vnd.jovian.variables+json": {"variables": var_list}}, raw=True)
-    except Exception as e:
-        error_var = {"name": "Error", "type": "Exception", "info": str(e)}
-        display({"application/vnd.jovian.variables+json": {"variables": [error_var]}}, raw=True)
-
-_jovian_get_variables()
-"""
-        self.var_msg_id = self.kc.execute(script, silent=False, store_history=True)
+    def view_dataframe(self, name, limit=100, col_limit=20, request_id=None):
+        args = {"name": name, "limit": limit, "col_limit": col_limit}
+        self._request("df_open", args, request_id)
 
-    def view_dataframe(self, name):
-        script = f"""
-import pandas as pd
-import numpy as np
-import json
-from IPython.display import display
+    def dataframe_page(self, view_id, window, request_id=None):
+        # window: offset/limit, col_offset/col_limit, sort and filter of the view
+        self._request("df_page", dict(window, view_id=view_id), request_id)
 
-def _jovian_view_df(name):
-    try:
-        if name not in globals(): return
-        val = globals()[name]
-        df = None
-        if isinstance(val, pd.DataFrame): df = val
-        elif isinstance(val, pd.Series): df = val.to_frame()
-        elif isinstance(val, np.ndarray):
-            if val.ndim <= 2: df = pd.DataFrame(val)
-        
-        if df is not None:
-            df_view = df.head(100)
-            data_json = df_view.to_json(orient='split', date_format='iso')
-            parsed = json.loads(data_json)
-            payload = {{
-                "name": name,
-                "columns": parsed.get('columns', []),
-                "index": parsed.get('index', []),
-                "data": parsed.get('data', [])
-            }}
-            display({{"application/vnd.jovian.dataframe+json": payload}}, raw=True)
-    except Exception as e:
-        pass
-
-_jovian_view_df("{name}")
-"""
-        self.var_msg_id = self.kc.execute(script, silent=False, store_history=True)
+    def dataframe_close(self, view_id):
+        self._request("df_close", {"view_id": view_id})
 
-    def peek(self, name):
-        script = f"""
-import sys
-from IPython.display import display
-
-def _jovian_peek(name):
-    try:
-        if name not in globals(): return
-        val = globals()[name]
-        type_name = type(val).__name__
-        
-        size_str = "unknown"
-        try:
-            size = sys.getsizeof(val)
-            if size < 1024: size_str = f"{{size}} B"
-            elif size < 1024**2: size_str = f"{{size/1024:.1f}} KB"
-            else: size_str = f"{{size/1024**2:.1f}} MB"
-        except: pass
-        
-        val_repr = repr(val)
-        if len(val_repr) > 500: val_repr = val_repr[:497] + "..."
-        
-        shape = ""
-        if hasattr(val, 'shape'):
-            shape = str(val.shape)
-            
-        result = {{
-            "name": name,
-            "type": type_name,
-            "size": size_str,
-            "repr": val_repr,
-            "shape": shape
-        }}
-        display({{"application/vnd.jovian.peek+json": result}}, raw=True)
-    except: pass
-
-_jovian_peek("{name}")
-"""
-        self.var_msg_id = self.kc.execute(script, silent=False, store_history=True)
+    def peek(self, name, request_id=None):
+        self._request("peek", {"name": name}, request_id)
 
-    def inspect(self, name):
+    def inspect(self, name, request_id=None):
         msg_id = self.kc.inspect(name, cursor_pos=len(name))
-        start_time = time.time()
-        while time.time() - start_time < 2:
-            try:
-                reply = self.kc.get_shell_msg(timeout=0.1)
-                if reply["parent_header"]["msg_id"] == msg_id:
-                    content = reply["content"]
-                    if content["status"] == "ok" and content["found"]:
-                        data = content["data"]
-                        docstring = data.get("text/plain", "No info")
-
-                        # Strip ANSI codes
-                        ansi_escape = re.compile(
-                            r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])"
-                        )
-                        docstring = ansi_escape.sub("", docstring)
-
-                        result = {
-                            "name": name,
-                            "type": "unknown",
-                            "docstring": docstring,
-                            "file": "",
-                            "definition": "",
-                        }
-                        send_json({"type": "inspection_data", "data": result})
-                    return
-            except queue.Empty:
-                continue
-            except Exception:
-                break
+        self._await_shell_reply(
+            msg_id,
+            lambda reply: self._on_inspect_reply(name, reply, request_id),
+            timeout=2,
+        )
 
-    def copy_to_clipboard(self, name):
-        script = f"""
-from IPython.display import display
-try:
-    if "{name}" in globals():
-        val = globals()["{name}"]
-        display({{"application/vnd.jovian.clipboard+json": {{"content": str(val)}}}}, raw=True)
-except Exception:
-    pass
-"""
-        self.var_msg_id = self.kc.execute(script, silent=False, store_history=True)
+    def _on_inspect_reply(self, name, reply, request_id=None):
+        content = reply["content"]
+        if content["status"] == "ok" and content["found"]:
+            data = content["data"]
+            docstring = data.get("text/plain", "No info")
 
-    def set_plot_mode(self, mode):
-        # send_json({"type": "debug", "msg": f"Setting plot mode to: {mode}"})
+            # Strip ANSI codes
+            ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+            docstring = ansi_escape.sub("", docstring)
 
-        # Update variable FIRST
-        cmd = f"_jovian_plot_mode = '{mode}'\n"
+            result = {
+                "name": name,
+                "type": "unknown",
+                "docstring": docstring,
+                "file": "",
+                "definition": "",
+            }
+            msg = {"type": "inspection_data", "data": result}
+            if request_id is not None:
+                msg["request_id"] = request_id
+            self.send(msg)
+
+    def plan_stale(self, cells, stale, request_id=None):
+        msg = {"type": "run_plan", "cells": plan_stale(cells, stale)}
+        if request_id is not None:
+            msg["request_id"] = request_id
+        self.send(msg)
+
+    def copy_to_clipboard(self, name, request_id=None):
+        self._request("clipboard", {"name": name}, request_id)
+
+    def configure(self, options):
+        output = options.get("output")
+        if isinstance(output, dict):
+            for key in ("max_lines", "max_bytes"):
+                if key in output:
+                    self.output_limits[key] = output[key]
+            if output.get("stream_flush_ms") is not None:
+                self.streams.interval = output["stream_flush_ms"] / 1000.0
+            if output.get("stream_batch_bytes") is not None:
+                self.streams.max_bytes = output["stream_batch_bytes"]
+        cell_cache = options.get("cell_cache")
+        if isinstance(cell_cache, dict) and cell_cache.get("max_bytes") is not None:
+            self.memo_max_bytes = cell_cache["max_bytes"]
+        telemetry = options.get("telemetry")
+        if isinstance(telemetry, dict):
+            self.tracemalloc = bool(telemetry.get("tracemalloc"))
+            if self.kc:
+                self.kc.execute(
+                    f"__import__('_jovian_runtime').telemetry.update(tracemalloc={self.tracemalloc})",
+                    silent=True,
+                    store_history=False,
+                )
+        figures = options.get("figures")
+        if isinstance(figures, dict):
+            self.figure_options = {
+                key: figures[key]
+                for key in ("format", "dpi", "max_pixels", "thumbnail_pixels", "async")
+                if key in figures
+            }
+            if self.kc:
+                self.kc.execute(
+                    f"__import__('_jovian_runtime').figures.update({self.figure_options!r})",
+                    silent=True,
+                    store_history=False,
+                )
+        pool = options.get("kernel_pool")
+        if isinstance(pool, dict):
+            self.pool_size = max(int(pool.get("size") or 0), 0)
+            self.pool_preload = [str(name) for name in pool.get("preload") or []]
+            self._fill_pool()
 
-        # Explicitly switch backend based on mode
-        if mode == "window":
-            cmd += "try: get_ipython().run_line_magic('matplotlib', 'tk'); print('[Jovian] Switched to tk backend')\nexcept: pass"
-        else:
-            cmd += "try: get_ipython().run_line_magic('matplotlib', 'inline'); print('[Jovian] Switched to inline backend')\nexcept: pass"
+    def set_plot_mode(self, mode):
+        # send_json({"type": "debug", "msg": f"Setting plot mode to: {mode}"})
+        self.kc.execute(
+            f"__import__('_jovian_runtime').set_plot_mode({mode!r})",
+            silent=True,
+            store_history=False,
+        )
 
-        self.kc.execute(cmd, silent=False, store_history=True)
+    def full_figures(self, cell_id, file_dir, request_id=None):
+        """Render a cell's thumbnailed figures at full size (figure_files reply)."""
+        store = self._output_store(file_dir or os.getcwd())
+        store._refresh()
+        blobs = (store.cells.get(cell_id) or {}).get("blobs", [])
+        args = {
+            "names": [os.path.basename(name) for name in blobs],
+            # Only a kernel we launched is known to share our filesystem
+            "dir": FIGURE_DIR if self.km else None,
+        }
+        self._request("render_figures", args, request_id)
+
+    def fetch_files(self, paths, hashes=None, request_id=None):
+        """Send output files to an editor that cannot read this filesystem.
+
+        Files whose sha256 matches hashes[path] (the copy the editor already
+        has) are skipped. The rest go out in file_data messages of about
+        FETCH_BATCH_BYTES; a file larger than that is split into parts
+        sent in order, each with its offset and final set on the last.
+        The last message has done=True.
+        """
+        if not isinstance(hashes, dict):
+            hashes = {}  # An empty Lua table is encoded as []
+        files, unchanged, missing = [], [], []
+        size = 0
+
+        def flush(done):
+            nonlocal files, size
+            msg = {"type": "file_data", "files": files, "done": done}
+            if done:
+                msg["unchanged"] = unchanged
+                msg["missing"] = missing
+            if request_id is not None:
+                msg["request_id"] = request_id
+            self.send(msg)
+            files, size = [], 0
+
+        for path in dict.fromkeys(paths):
+            try:
+                with open(path, "rb") as f:
+                    sha = hashlib.sha256()
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        sha.update(block)
+                    digest = sha.hexdigest()
+                    if hashes.get(path) == digest:
+                        unchanged.append(path)
+                        continue
+                    f.seek(0)
+                    total = os.fstat(f.fileno()).st_size
+                    offset = 0
+                    while True:
+                        if size >= FETCH_BATCH_BYTES:
+                            flush(False)
+                        data = f.read(FETCH_BATCH_BYTES - size)
+                        final = offset + len(data) >= total or not data
+                        files.append(
+                            {
+                                "path": path,
+                                "sha256": digest,
+                                "offset": offset,
+                                "final": final,
+                                "data": base64.b64encode(data).decode("ascii"),
+                            }
+                        )
+                        offset += len(data)
+                        size += len(data)
+                        if final:
+                            break
+            except OSError:
+                missing.append(path)
+        flush(True)
 
     def purge_cache(self, ids, file_dir):
         if not file_dir or not os.path.exists(file_dir):
             return
 
         try:
-            valid_set = set(ids)
-            # send_json({"type": "debug", "msg": f"Purging cache in {file_dir}, valid ids: {len(valid_set)}"})
-
-            for f in os.listdir(file_dir):
-                # Files: {id}.md, {id}_{counter}.png
-                # We need to extract the ID from the filename.
-                # Filename format: ID.md or ID_XX.png
-
-                file_id = None
-                if f.endswith(".md"):
-                    file_id = f[:-3]
-                elif f.endswith(".png"):
-                    # ID_XX.png
-                    # Find the last underscore
-                    last_underscore = f.rfind("_")
-                    if last_underscore != -1:
-                        file_id = f[:last_underscore]
-
-                if file_id and file_id not in valid_set:
-                    try:
-                        os.remove(os.path.join(file_dir, f))
-                        # send_json({"type": "debug", "msg": f"Deleted stale cache: {f}"})
-                    except Exception as e:
-                        pass
-                        # send_json({"type": "debug", "msg": f"Failed to delete {f}: {e}"})
+            self._output_store(file_dir).purge(set(ids))
         except Exception as e:
             pass
             # send_json({"type": "debug", "msg": f"Purge error: {e}"})
@@ -832,66 +2179,303 @@ except Exception:
             return
 
         try:
-            remove_set = set(ids)
-            for f in os.listdir(file_dir):
-                file_id = None
-                if f.endswith(".md"):
-                    file_id = f[:-3]
-                elif f.endswith(".png"):
-                    last_underscore = f.rfind("_")
-                    if last_underscore != -1:
-                        file_id = f[:last_underscore]
-
-                if file_id and file_id in remove_set:
-                    try:
-                        os.remove(os.path.join(file_dir, f))
-                        # send_json({"type": "debug", "msg": f"Removed cache: {f}"})
-                    except:
-                        pass
+            self._output_store(file_dir).drop(ids)
         except:
             pass
 
 
+def dispatch(bridge, cmd):
+    # request_id is chosen by Neovim and echoed in the replies to this command
+    request_id = cmd.get("request_id")
+    if cmd.get("command") == "execute":
+        bridge.execute_code(
+            cmd["code"],
+            cmd["cell_id"],
+            cmd.get("file_dir"),
+            cmd.get("cwd"),
+            request_id,
+            cmd.get("cache", False),
+        )
+    elif cmd.get("command") == "profile":
+        bridge.execute_code(
+            cmd["code"],
+            cmd["cell_id"],
+            cmd.get("file_dir"),
+            cmd.get("cwd"),
+            request_id,
+            profile={"sample_ms": cmd.get("sample_ms", 5)},
+        )
+    elif cmd.get("command") == "get_variables":
+        bridge.get_variables(cmd.get("snapshot"), request_id)
+    elif cmd.get("command") == "view_dataframe":
+        bridge.view_dataframe(
+            cmd["name"], cmd.get("limit", 100), cmd.get("col_limit", 20), request_id
+        )
+    elif cmd.get("command") == "df_page":
+        window = {
+            key: cmd.get(key)
+            for key in ("offset", "limit", "col_offset", "col_limit", "sort", "filter")
+            if key in cmd
+        }
+        bridge.dataframe_page(cmd["view_id"], window, request_id)
+    elif cmd.get("command") == "df_close":
+        bridge.dataframe_close(cmd["view_id"])
+    elif cmd.get("command") == "plan_stale":
+        bridge.plan_stale(cmd.get("cells") or [], cmd.get("stale") or [], request_id)
+    elif cmd.get("command") == "peek":
+        bridge.peek(cmd["name"], request_id)
+    elif cmd.get("command") == "inspect":
+        bridge.inspect(cmd["name"], request_id)
+    elif cmd.get("command") == "copy_to_clipboard":
+        bridge.copy_to_clipboard(cmd["name"], request_id)
+    elif cmd.get("command") == "input_reply":
+        bridge.input_reply(cmd.get("value", ""))
+    elif cmd.get("command") == "configure":
+        bridge.configure(cmd)
+    elif cmd.get("command") == "restart":
+        bridge.restart()
+    elif cmd.get("command") == "interrupt":
+        bridge.interrupt()
+    elif cmd.get("command") == "set_plot_mode":
+        bridge.set_plot_mode(cmd["mode"])
+    elif cmd.get("command") == "full_figures":
+        bridge.full_figures(cmd["cell_id"], cmd.get("file_dir"), request_id)
+    elif cmd.get("command") == "fetch_files":
+        bridge.fetch_files(cmd["paths"], cmd.get("hashes"), request_id)
+    elif cmd.get("command") == "purge_cache":
+        bridge.purge_cache(cmd["ids"], cmd.get("file_dir"))
+    elif cmd.get("command") == "remove_cache":
+        bridge.remove_cache(cmd["ids"], cmd.get("file_dir"))
+
+
+# --- Daemon Mode ---
+class BridgeDaemon:
+    """Serves kernel sessions to editors over a Unix socket.
+
+    A client's first line attaches it to a named session, which is created
+    (with its kernel) on first use and outlives the clients. Request ids are
+    renumbered so replies only reach the editor that asked; all other
+    messages of a session go to every client attached to it.
+    """
+
+    MAX_REQUESTS = 4096
+
+    def __init__(self, path):
+        self.path = path
+        self.loop = EventLoop()
+        self.server = None
+        self.sessions = {}  # name -> KernelBridge
+        self.clients = {}  # fd -> {"sock", "buffer", "session"}
+        self.request_seq = 0
+        self.request_owners = collections.OrderedDict()  # daemon id -> (client, id)
+
+    def serve(self):
+        try:
+            # Another daemon already owns the socket
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            probe.connect(self.path)
+            probe.close()
+            return
+        except OSError:
+            pass
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)  # Only the owner may attach
+        try:
+            self.server.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.server.listen()
+        self.server.setblocking(False)
+        self.loop.add_reader(self.server.fileno(), self._accept)
+
+        atexit.register(self.cleanup)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        self.loop.run()
+
+    def cleanup(self):
+        for bridge in self.sessions.values():
+            bridge.cleanup()
+        self.sessions = {}
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _accept(self):
+        try:
+            conn, _ = self.server.accept()
+        except BlockingIOError:
+            return
+        # Replies are written with a timeout rather than buffered per client
+        conn.settimeout(10)
+        client = {"sock": conn, "buffer": bytearray(), "session": None, "protocol": 1}
+        self.clients[conn.fileno()] = client
+        self.loop.add_reader(conn.fileno(), lambda: self._on_client(client))
+
+    def _on_client(self, client):
+        try:
+            data = client["sock"].recv(1 << 16)
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(client)
+            return
+        buffer = client["buffer"]
+        buffer.extend(data)
+        while True:
+            end = buffer.find(b"\n")
+            if end < 0:
+                break
+            line = bytes(buffer[:end])
+            del buffer[: end + 1]
+            try:
+                cmd = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.loop.call(lambda: self._handle(client, cmd))
+
+    def _handle(self, client, cmd):
+        if client["session"] is None:
+            if cmd.get("command") == "attach":
+                self._attach(client, cmd)
+            return
+
+        name = client["session"]
+        bridge = self.sessions.get(name)
+        if bridge is None:
+            return
+        if cmd.get("command") == "configure" and "protocol" in cmd:
+            # Framing is per editor; the relay passes bytes through unchanged
+            version = negotiate_protocol(cmd["protocol"])
+            self._send(client, {"type": "protocol", "version": version})
+            client["protocol"] = version
+        if cmd.get("command") == "shutdown":
+            self._shutdown(name)
+            return
+        if "request_id" in cmd:
+            self.request_seq += 1
+            self.request_owners[self.request_seq] = (client, cmd["request_id"])
+            if len(self.request_owners) > self.MAX_REQUESTS:
+                self.request_owners.popitem(last=False)
+            cmd["request_id"] = self.request_seq
+        dispatch(bridge, cmd)
+
+    def _attach(self, client, cmd):
+        name = cmd.get("session") or "default"
+        client["session"] = name
+        bridge = self.sessions.get(name)
+        if bridge is not None:
+            # A kernel still starting announces ready to every attached client
+            if bridge.starting is None:
+                # The kernel is already up; treat this like a fresh bridge start
+                self._send(client, {"type": "ready", "attached": True})
+            return
+
+        # The kernel starts in the background so other sessions keep being served
+        bridge = KernelBridge(connection_file=cmd.get("connection_file"), loop=self.loop)
+        bridge.send = lambda msg: self._publish(name, msg)
+        bridge.on_failed = lambda: self.sessions.pop(name, None)
+        self.sessions[name] = bridge
+        bridge.start()
+
+    def _shutdown(self, name):
+        bridge = self.sessions.pop(name, None)
+        if bridge is not None:
+            bridge._detach_kernel()
+            bridge.stop()
+        for client in list(self.clients.values()):
+            if client["session"] == name:
+                self._drop(client)
+
+    def _publish(self, name, msg):
+        owner = self.request_owners.get(msg.get("request_id"))
+        if owner is not None:
+            client, request_id = owner
+            if client["sock"].fileno() >= 0:
+                self._send(client, dict(msg, request_id=request_id))
+            return
+        for client in list(self.clients.values()):
+            if client["session"] == name:
+                self._send(client, msg)
+
+    def _send(self, client, msg):
+        try:
+            client["sock"].sendall(encode_message(msg, client["protocol"]).encode())
+        except OSError:
+            self._drop(client)
+
+    def _drop(self, client):
+        fd = client["sock"].fileno()
+        if fd < 0:
+            return
+        self.loop.remove_reader(fd)
+        self.clients.pop(fd, None)
+        client["sock"].close()
+        # Nothing left to serve
+        if not self.clients and not self.sessions:
+            self.loop.stop()
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--connection-file", help="Path to Jupyter connection file")
+    parser.add_argument("--daemon", action="store_true", help="Serve sessions on a Unix socket")
+    parser.add_argument("--socket", help="Daemon socket path")
     args = parser.parse_args()
 
+    if args.daemon:
+        from bridge_attach import default_socket_path
+
+        BridgeDaemon(args.socket or default_socket_path()).serve()
+        return
+
     bridge = KernelBridge(connection_file=args.connection_file)
     bridge.start()
 
     # send_json({"type": "debug", "msg": "Kernel Bridge Started"})
 
-    while True:
-        try:
-            line = sys.stdin.readline()
-            if not line:
+    # Commands arrive on stdin as JSON lines and are served by the same loop
+    stdin_fd = sys.stdin.fileno()
+    pending = bytearray()
+
+    def on_stdin():
+        data = os.read(stdin_fd, 1 << 16)
+        if not data:
+            bridge.loop.stop()
+            return
+        pending.extend(data)
+        while True:
+            end = pending.find(b"\n")
+            if end < 0:
                 break
-            cmd = json.loads(line)
+            line = bytes(pending[:end])
+            del pending[: end + 1]
+            try:
+                cmd = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            bridge.loop.call(lambda: handle(cmd))
 
-            if cmd.get("command") == "execute":
-                bridge.execute_code(
-                    cmd["code"], cmd["cell_id"], cmd.get("file_dir"), cmd.get("cwd")
-                )
-            elif cmd.get("command") == "get_variables":
-                bridge.get_variables()
-            elif cmd.get("command") == "view_dataframe":
-                bridge.view_dataframe(cmd["name"])
-            elif cmd.get("command") == "peek":
-                bridge.peek(cmd["name"])
-            elif cmd.get("command") == "inspect":
-                bridge.inspect(cmd["name"])
-            elif cmd.get("command") == "copy_to_clipboard":
-                bridge.copy_to_clipboard(cmd["name"])
-            elif cmd.get("command") == "set_plot_mode":
-                bridge.set_plot_mode(cmd["mode"])
-            elif cmd.get("command") == "purge_cache":
-                bridge.purge_cache(cmd["ids"], cmd.get("file_dir"))
-            elif cmd.get("command") == "remove_cache":
-                bridge.remove_cache(cmd["ids"], cmd.get("file_dir"))
-
-        except json.JSONDecodeError:
-            pass
+    def handle(cmd):
+        global stdout_protocol
+        if cmd.get("command") == "configure" and "protocol" in cmd:
+            version = negotiate_protocol(cmd["protocol"])
+            # Acknowledged in the old format; everything after uses the new one
+            send_json({"type": "protocol", "version": version})
+            stdout_protocol = version
+        dispatch(bridge, cmd)
+
+    bridge.loop.add_reader(stdin_fd, on_stdin)
+
+    while True:
+        try:
+            bridge.loop.run()
+            break
         except KeyboardInterrupt:
             # Handle SIGINT from Neovim
             bridge.interrupt()
@@ -110,6 +110,17 @@ function M.ensure_cell_id(line_num, line_content)
 	return id
 end
 
+-- Words after the id on a cell header are tags, e.g. `# %% id="abc" cache`
+function M.has_tag(line, tag)
+	local rest = line:match('id="[%w%-_]+"(.*)$')
+	for word in (rest or ""):gmatch("%S+") do
+		if word == tag then
+			return true
+		end
+	end
+	return false
+end
+
 function M.get_current_cell_id(lnum, create)
 	local s, _ = M.get_cell_range(lnum)
 	local lines = vim.api.nvim_buf_get_lines(0, s - 1, s, false)
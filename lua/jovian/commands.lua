@@ -93,7 +93,9 @@ function M.setup()
 	vim.api.nvim_create_user_command("JovianRun", Core.send_cell, {})
 	vim.api.nvim_create_user_command("JovianSendSelection", Core.send_selection, { range = true })
 	vim.api.nvim_create_user_command("JovianRunAll", Core.run_all_cells, {})
+	vim.api.nvim_create_user_command("JovianRunStale", Core.run_stale_cells, {})
 	vim.api.nvim_create_user_command("JovianRestart", Core.restart_kernel, {})
+	vim.api.nvim_create_user_command("JovianShutdown", Core.shutdown_kernel, {})
 
 	-- Host Management
 	vim.api.nvim_create_user_command("JovianAddHost", function(opts)
@@ -234,6 +236,7 @@ function M.setup()
 	vim.api.nvim_create_user_command("JovianView", Core.view_dataframe, { nargs = "?" })
 	vim.api.nvim_create_user_command("JovianCopy", Core.copy_variable, { nargs = "?" })
 	vim.api.nvim_create_user_command("JovianProfile", Core.run_profile_cell, {})
+	vim.api.nvim_create_user_command("JovianFigures", Core.full_figures, {})
     vim.api.nvim_create_user_command("JovianBackend", Core.print_backend, {})
 
 	-- Navigation
@@ -10,12 +10,88 @@ M.defaults = {
 
 	-- Python Environment
 	python_interpreter = "python3",
+	-- Keep the shared ssh connection to a remote host open this long after
+	-- its last use (false = a new connection per ssh/scp call)
+	ssh_control_persist = "10m",
+	ssh_compression = true, -- Compress ssh traffic (bridge messages, syncs, file fetches)
 
 	-- Behavior
 	notify_threshold = 10,
 	notify_mode = "all", -- "all", "error", "none"
 	show_execution_time = true,
 	plot_view_mode = "inline", -- "inline", "window"
+	variables_refresh_ms = 2000, -- Refresh the variables pane while cells run (0 = off)
+
+	-- Output Capture (per cell)
+	-- Past either limit the middle of the output is elided from the preview
+	-- and the full log is written to .jovian_cache/<file>/<cell_id>.log
+	output = {
+		max_lines = 10000,
+		max_bytes = 4 * 1024 * 1024,
+		-- Stream output is forwarded to the REPL in batches
+		stream_flush_ms = 30,
+		stream_batch_bytes = 64 * 1024,
+	},
+
+	-- Figure capture (plt.show). Raster figures are drawn in the kernel and
+	-- encoded on a worker thread while the cell goes on
+	figures = {
+		format = "png", -- "png", "jpeg", "webp", "svg"
+		dpi = nil, -- nil = matplotlib's savefig.dpi
+		max_pixels = 4000, -- Longest side; larger figures are rendered at a lower DPI
+		thumbnail_pixels = nil, -- Preview at this size; :JovianFigures renders full size
+		async = true,
+	},
+
+	-- Per-cell resource usage (wall, CPU, peak RSS, GPU memory), shown
+	-- next to the cell's status and kept with its cached output
+	telemetry = {
+		show = true,
+		tracemalloc = false, -- Also trace Python allocation peaks (slows allocations)
+	},
+
+	-- Outputs longer than max_lines (with a .md.idx from the bridge) are
+	-- previewed a page at a time: first and last page, more as you scroll
+	preview = {
+		max_lines = 2000,
+		page_lines = 500,
+		-- Recently viewed outputs stay loaded for instant switching
+		cache_buffers = 8,
+		cache_bytes = 32 * 1024 * 1024,
+	},
+
+	-- :JovianProfile runs the cell under cProfile and samples which cell
+	-- line is executing to attribute time to lines
+	profile = {
+		sample_ms = 5, -- Sampling interval (0 = function stats only)
+	},
+
+	-- Cells tagged `cache` (# %% id="..." cache) save the values they define;
+	-- re-running one with unchanged code and inputs restores them and its
+	-- output instead of executing. Kept in .jovian_cache/<file>/memo/.
+	cell_cache = {
+		max_bytes = 1024 * 1024 * 1024, -- Least recently used entries go past this size
+	},
+
+	-- Warm kernel pool (kernels started by Jovian only)
+	-- Spare kernels are started and prepared in the background, so
+	-- :JovianRestart swaps to one instead of waiting for a cold start.
+	kernel_pool = {
+		size = 0, -- Number of spare kernels (0 = off)
+		preload = {}, -- Modules imported in spares ahead of time, e.g. { "numpy", "pandas" }
+	},
+
+	-- Bridge daemon
+	-- Kernels live in a background process on the kernel host and survive
+	-- editor restarts; editors attach to a named session over a Unix socket.
+	daemon = {
+		enabled = false,
+		socket = nil, -- Default: $XDG_RUNTIME_DIR (or /tmp)/jovian-<uid>.sock
+		session = nil, -- Default: the current working directory
+	},
+
+	-- Bridge output protocol: 2 = length-prefixed frames, 1 = JSON lines
+	bridge_protocol = 2,
 
 	ui = {
 		-- cell_separator_highlight:
@@ -5,6 +5,7 @@ local UI = require("jovian.ui")
 local Utils = require("jovian.utils")
 local Cell = require("jovian.cell")
 local Session = require("jovian.session")
+local Protocol = require("jovian.protocol")
 
 local function is_window_open()
 	return State.win.output and vim.api.nvim_win_is_valid(State.win.output)
@@ -16,52 +17,93 @@ local Hosts = require("jovian.hosts")
 
 local Handlers = require("jovian.handlers")
 
-local function on_stdout(chan_id, data, name)
-	if not data then
-		return
+-- Sends a command tagged with a fresh request_id, which the backend echoes in its replies.
+-- opts (if given) are kept in State.pending_requests until take_request() claims the reply.
+function M.send_command(payload, opts)
+	if not State.job_id then
+		return nil
 	end
-
-	-- Buffering processing
-	if not State.stdout_buffer then
-		State.stdout_buffer = ""
+	State.request_seq = State.request_seq + 1
+	payload.request_id = State.request_seq
+	if opts then
+		State.pending_requests[payload.request_id] = vim.tbl_extend("force", { command = payload.command }, opts)
 	end
+	vim.api.nvim_chan_send(State.job_id, vim.json.encode(payload) .. "\n")
+	return payload.request_id
+end
 
-	-- Concatenate data
-	local chunk = table.concat(data, "\n")
-	State.stdout_buffer = State.stdout_buffer .. chunk
-
-	-- Split by newline and process
-	local lines = vim.split(State.stdout_buffer, "\n")
-
-	-- The last element is likely an incomplete line, so put it back in buffer
-	State.stdout_buffer = table.remove(lines)
+function M.take_request(msg)
+	if not msg.request_id then
+		return nil
+	end
+	local request = State.pending_requests[msg.request_id]
+	State.pending_requests[msg.request_id] = nil
+	return request
+end
 
-	for _, line in ipairs(lines) do
-		if line ~= "" then
-			local ok, msg = pcall(vim.fn.json_decode, line)
-			if ok and msg then
-				vim.schedule(function()
-                    local handler_name = "handle_" .. msg.type
-                    if Handlers[handler_name] then
-                        Handlers[handler_name](msg)
-                    else
-                        -- Fallback or ignore
-                    end
-				end)
+local function dispatch_messages(msgs)
+	for _, msg in ipairs(msgs) do
+		if msg.raw then
+			-- Failed to decode JSON, likely an error message or debug output
+			vim.notify("Jovian Backend: " .. msg.raw, vim.log.levels.WARN)
+		elseif msg.type then
+			local handler_name = "handle_" .. msg.type
+			if Handlers[handler_name] then
+				Handlers[handler_name](msg)
 			else
-				-- Failed to decode JSON, likely an error message or debug output
-				vim.schedule(function()
-					vim.notify("Jovian Backend: " .. line, vim.log.levels.WARN)
-				end)
+				-- Fallback or ignore
 			end
 		end
 	end
 end
 
+-- stdout and stderr each get their own reader
+local function output_handler()
+	local reader = Protocol.new_reader()
+	return function(_, data)
+		if not data then
+			return
+		end
+		local msgs = Protocol.feed(reader, data)
 
+		-- One scheduled callback per chunk keeps the main loop responsive under heavy output
+		if #msgs > 0 then
+			vim.schedule(function()
+				dispatch_messages(msgs)
+			end)
+		end
+	end
+end
+
+-- Daemon mode: a small relay attaches to the (possibly remote) bridge daemon
+local function daemon_args(cmd)
+    local daemon = Config.options.daemon
+    if daemon.socket then
+        vim.list_extend(cmd, { "--socket", daemon.socket })
+    end
+    vim.list_extend(cmd, { "--session", daemon.session or vim.fn.getcwd() })
+    if Config.options.connection_file then
+        vim.list_extend(cmd, { "--connection-file", Config.options.connection_file })
+    end
+    return cmd
+end
 
 function M._prepare_kernel_command(script_path)
     local cmd = {}
+    if Config.options.daemon and Config.options.daemon.enabled then
+        local attach_script = vim.fn.fnamemodify(script_path, ":h") .. "/bridge_attach.py"
+        if Config.options.ssh_host and not Config.options.connection_file then
+            cmd = Hosts.ssh_command(
+                Config.options.ssh_host,
+                { Config.options.ssh_python, "-u", "/tmp/jovian_backend/bridge_attach.py" }
+            )
+        else
+            cmd = vim.split(Config.options.python_interpreter, " ")
+            table.insert(cmd, attach_script)
+        end
+        UI.append_to_repl("[Jovian] Attaching to bridge daemon", "Special")
+        return daemon_args(cmd)
+    end
     if Config.options.connection_file then
         -- Connect to existing kernel via connection file
         cmd = vim.split(Config.options.python_interpreter, " ")
@@ -72,7 +114,7 @@ function M._prepare_kernel_command(script_path)
     elseif Config.options.ssh_host then
         local host = Config.options.ssh_host
         local remote_python = Config.options.ssh_python
-        cmd = { "ssh", host, remote_python, "-u", "/tmp/jovian_backend/kernel_bridge.py" }
+        cmd = Hosts.ssh_command(host, { remote_python, "-u", "/tmp/jovian_backend/kernel_bridge.py" })
         UI.append_to_repl("[Jovian] Connecting to remote: " .. host, "Special")
     else
         -- Local execution
@@ -82,62 +124,56 @@ function M._prepare_kernel_command(script_path)
     return cmd
 end
 
+-- Validates the remote interpreter, compares the backend hash and uploads the
+-- backend in a single ssh round trip. The archive is small, so sending it
+-- unconditionally is cheaper than a second round trip to ask first.
 function M.sync_backend(host, backend_dir, on_success, on_error)
     -- Calculate local hash
-    local hash_cmd = "sha256sum " .. backend_dir .. "/* | sha256sum | awk '{print $1}'"
+    local hash_cmd = "sha256sum " .. backend_dir .. "/*.py | sha256sum | awk '{print $1}'"
     local local_hash = vim.fn.trim(vim.fn.system(hash_cmd))
-    
-    -- Check remote hash
-    local check_cmd = string.format("ssh %s 'cat /tmp/jovian_backend/.hash 2>/dev/null'", host)
-    
-    local function do_sync()
-        -- Sync files and update hash
-        local setup_cmd = string.format("ssh %s 'rm -rf /tmp/jovian_backend && mkdir -p /tmp/jovian_backend'", host)
-        
-        vim.fn.jobstart(setup_cmd, {
-            on_exit = function(_, code)
-                if code ~= 0 then
-                    if on_error then on_error("Failed to prepare remote directory on " .. host) end
-                    return
-                end
-                
-                local scp_cmd = string.format("scp -r %s/. %s:/tmp/jovian_backend", backend_dir, host)
-                vim.fn.jobstart(scp_cmd, {
-                    on_exit = function(_, scp_code)
-                        if scp_code ~= 0 then
-                            if on_error then on_error("Failed to sync backend to " .. host) end
-                        else
-                            -- Write hash file
-                            local hash_write_cmd = string.format("ssh %s 'echo %s > /tmp/jovian_backend/.hash'", host, local_hash)
-                            vim.fn.jobstart(hash_write_cmd, {
-                                on_exit = function()
-                                    if on_success then on_success() end
-                                end
-                            })
-                        end
-                    end
-                })
-            end
-        })
-    end
-
-    vim.fn.jobstart(check_cmd, {
-        stdout_buffered = true,
-        on_stdout = function(_, data)
-            if data and data[1] and vim.trim(data[1]) == local_hash then
-                if on_success then on_success() end
-            else
-                do_sync()
-            end
-        end,
+    local python = Config.options.ssh_python or "python3"
+
+    local remote_script = table.concat({
+        "py=" .. vim.fn.shellescape(python) .. "; dir=/tmp/jovian_backend; hash=" .. local_hash,
+        '"$py" --version >/dev/null 2>&1 || { cat >/dev/null; exit 3; }',
+        'if [ "$(cat "$dir/.hash" 2>/dev/null)" = "$hash" ]; then cat >/dev/null; exit 0; fi',
+        'rm -rf "$dir.new" && mkdir -p "$dir.new" && tar -xzf - -C "$dir.new"'
+            .. ' && echo "$hash" > "$dir.new/.hash" && rm -rf "$dir" && mv "$dir.new" "$dir"',
+    }, "\n")
+    local ssh_cmd = Hosts.ssh_command(host, { "sh -c " .. vim.fn.shellescape(remote_script) })
+    local sync_cmd = string.format(
+        "tar -C %s --exclude=__pycache__ -czf - . | %s",
+        vim.fn.shellescape(backend_dir),
+        table.concat(vim.tbl_map(vim.fn.shellescape, ssh_cmd), " ")
+    )
+
+    vim.fn.jobstart(sync_cmd, {
         on_exit = function(_, code)
-            if code ~= 0 then
-                do_sync()
+            if code == 0 then
+                if on_success then on_success() end
+            elseif on_error then
+                if code == 255 then
+                    on_error("Could not connect to " .. host .. ". Check SSH config/keys.")
+                elseif code == 3 then
+                    on_error("Python interpreter '" .. python .. "' not found or not executable on " .. host .. ".")
+                else
+                    on_error("Failed to sync backend to " .. host)
+                end
             end
         end
     })
 end
 
+-- Per-kernel state that is lost when the bridge exits or swaps kernels
+local function reset_kernel_state()
+	State.bridge_protocol = nil
+	State.pending_requests = {}
+	State.vars_refresh_request = nil
+	State.variables = { snapshot = nil, entries = {} }
+	State.dataframe_views = {}
+	State.remote_fetch = { paths = {}, queued = {}, callbacks = {}, in_flight = false }
+end
+
 function M.start_kernel(on_ready)
     -- If called from command, on_ready might be a table (args). Ignore it.
     if type(on_ready) ~= "function" then on_ready = nil end
@@ -150,20 +186,24 @@ function M.start_kernel(on_ready)
 	-- Ensure IDs are unique before starting
 	Cell.fix_duplicate_ids(0)
 
-    -- Async Validation and Start
-    Hosts.validate_connection(nil, function()
-        -- Success callback
+    local function on_error(err)
+        UI.append_to_repl("[Error] " .. err, "ErrorMsg")
+        vim.notify(err, vim.log.levels.ERROR)
+    end
+
+    local function on_valid()
         local script_path = vim.fn.fnamemodify(debug.getinfo(1).source:sub(2), ":h:h:h") .. "/lua/jovian/backend/kernel_bridge.py"
         local backend_dir = vim.fn.fnamemodify(debug.getinfo(1).source:sub(2), ":h:h:h") .. "/lua/jovian/backend"
         
         local function launch()
             local cmd = M._prepare_kernel_command(script_path)
             State.job_id = vim.fn.jobstart(cmd, {
-                on_stdout = on_stdout,
-                on_stderr = on_stdout,
+                on_stdout = output_handler(),
+                on_stderr = output_handler(),
                 stdout_buffered = false,
                 on_exit = function()
                     State.job_id = nil
+                    reset_kernel_state()
                 end,
             })
             -- UI.append_to_repl("[Jovian Kernel Started]")
@@ -174,24 +214,38 @@ function M.start_kernel(on_ready)
 
         if Config.options.ssh_host then
             UI.append_to_repl("[Jovian] Syncing backend to remote...", "Special")
-            M.sync_backend(Config.options.ssh_host, backend_dir, function()
-                launch()
-            end, function(err)
-                UI.append_to_repl("[Error] " .. err, "ErrorMsg")
-                vim.notify(err, vim.log.levels.ERROR)
-            end)
+            M.sync_backend(Config.options.ssh_host, backend_dir, launch, on_error)
         else
             launch()
         end
+    end
 
-    end, function(err)
-        -- Error callback
-        UI.append_to_repl("[Error] " .. err, "ErrorMsg")
-        vim.notify(err, vim.log.levels.ERROR)
-    end)
+    -- Async Validation and Start
+    if Config.options.ssh_host and not Config.options.connection_file then
+        -- sync_backend checks the host and interpreter in the same round trip
+        on_valid()
+    else
+        Hosts.validate_connection(nil, on_valid, on_error)
+    end
 end
 
-function M.restart_kernel()
+-- opts.full: replace the bridge process too (needed after switching hosts)
+function M.restart_kernel(opts)
+	local full = type(opts) == "table" and opts.full
+	local pool = Config.options.kernel_pool
+	local swap = (pool and (pool.size or 0) > 0) or (Config.options.daemon and Config.options.daemon.enabled)
+	if State.job_id and not full and swap and not Config.options.connection_file then
+		-- The bridge swaps in a (warm) kernel and answers with "ready"; in daemon
+		-- mode this also keeps the session other editors are attached to
+		UI.append_to_repl("[Kernel Restarting...]", "WarningMsg")
+		UI.clear_status_extmarks(0)
+		reset_kernel_state()
+		State.cell_buf_map = {}
+		State.cell_start_time = {}
+		M.send_command({ command = "restart" })
+		return
+	end
+
 	if State.job_id then
 		vim.fn.jobstop(State.job_id)
 		State.job_id = nil
@@ -204,10 +258,11 @@ function M.restart_kernel()
 	M.start_kernel()
 end
 
-function M.send_payload(code, cell_id, filename)
+-- extra: fields merged into the execute payload (e.g. command = "profile")
+function M.send_payload(code, cell_id, filename, extra)
 	if not State.job_id then
 		M.start_kernel(function()
-            M.send_payload(code, cell_id, filename)
+            M.send_payload(code, cell_id, filename, extra)
         end)
         return
 	end
@@ -218,9 +273,11 @@ function M.send_payload(code, cell_id, filename)
     State.cell_hashes[cell_id] = Cell.get_cell_hash(code)
 
 	local lines = vim.api.nvim_buf_get_lines(current_buf, 0, -1, false)
+	local cache = false
 	for i, line in ipairs(lines) do
 		if line:find('id="' .. cell_id .. '"', 1, true) then
 			State.cell_start_line[cell_id] = i + 1
+			cache = Cell.has_tag(line, "cache")
 			break
 		end
 	end
@@ -246,29 +303,39 @@ function M.send_payload(code, cell_id, filename)
 		cell_id = cell_id,
 		file_dir = cache_dir,
 		cwd = file_dir,
+		cache = cache,
 	}
+	payload = vim.tbl_extend("force", payload, extra or {})
     
     -- Store hash for stale detection
     State.cell_hashes[cell_id] = Cell.get_cell_hash(code)
     
-	local msg = vim.json.encode(payload)
-	vim.api.nvim_chan_send(State.job_id, msg .. "\n")
+	M.send_command(payload, { cell_id = cell_id })
 end
 
 -- Add: Profiling
+-- Runs like a normal execution (output, status, cache files) with stats on top
 function M.profile_cell(code, cell_id)
-	if not State.job_id then
-		M.start_kernel(function()
-            M.profile_cell(code, cell_id)
-        end)
-        return
-	end
-	local msg = vim.json.encode({
+	M.send_payload(code, cell_id, nil, {
 		command = "profile",
-		code = code,
-		cell_id = cell_id,
+		sample_ms = Config.options.profile.sample_ms,
 	})
-	vim.api.nvim_chan_send(State.job_id, msg .. "\n")
+end
+
+-- Renders the current cell's thumbnailed figures at full size and opens them
+function M.full_figures()
+	if not State.job_id then
+		return vim.notify("Kernel not started", vim.log.levels.WARN)
+	end
+	local filename = vim.fn.expand("%:t")
+	if filename == "" then
+		filename = "scratchpad"
+	end
+	M.send_command({
+		command = "full_figures",
+		cell_id = Cell.get_current_cell_id(nil, false),
+		file_dir = vim.fn.expand("%:p:h") .. "/.jovian_cache/" .. filename,
+	}, {})
 end
 
 -- Add: Copy
@@ -283,8 +350,7 @@ function M.copy_variable(args)
 	if var_name == "" then
 		var_name = vim.fn.expand("<cword>")
 	end
-	local msg = vim.json.encode({ command = "copy_to_clipboard", name = var_name })
-	vim.api.nvim_chan_send(State.job_id, msg .. "\n")
+	M.send_command({ command = "copy_to_clipboard", name = var_name }, {})
 end
 
 function M.print_backend()
@@ -411,30 +477,17 @@ function M.run_line()
 	M.send_payload(line, id, fn)
 end
 
-function M.run_all_cells()
-	if not is_window_open() then
-		return vim.notify("Jovian windows are closed.", vim.log.levels.WARN)
-	end
-	local src_win = vim.api.nvim_get_current_win()
-	vim.api.nvim_set_current_win(src_win)
-	if not State.job_id then
-		M.start_kernel()
-	end
-	local fn = vim.fn.expand("%:t")
-	if fn == "" then
-		fn = "untitled"
-	end
-	local lines = vim.api.nvim_buf_get_lines(0, 0, -1, false)
-	local blk, bid, is_code = {}, "scratchpad", true
-    
-    local queue = {}
+-- Code cells of lines in order: { code, id, line } (line = header line, nil for the scratchpad)
+local function collect_code_cells(lines)
+	local blk, bid, header, is_code = {}, "scratchpad", nil, true
+	local queue = {}
 
 	for i, line in ipairs(lines) do
 		if line:match("^# %%%%") then
 			if #blk > 0 and is_code then
-                table.insert(queue, { code = table.concat(blk, "\n"), id = bid })
+				table.insert(queue, { code = table.concat(blk, "\n"), id = bid, line = header })
 			end
-			blk, bid = {}, Cell.ensure_cell_id(i, line)
+			blk, bid, header = {}, Cell.ensure_cell_id(i, line), i
 			is_code = not line:lower():match("^# %%%%+%s*%[markdown%]")
 		else
 			if is_code then
@@ -443,15 +496,35 @@ function M.run_all_cells()
 		end
 	end
 	if #blk > 0 and is_code then
-        table.insert(queue, { code = table.concat(blk, "\n"), id = bid })
+		table.insert(queue, { code = table.concat(blk, "\n"), id = bid, line = header })
 	end
+	return queue
+end
 
-    if #queue > 0 then
-        State.batch_execution = { total = #queue, current = 0, start_time = os.time() }
-        for _, item in ipairs(queue) do
-            M.send_payload(item.code, item.id, fn)
-        end
-    end
+local function run_queue(queue, fn)
+	if #queue > 0 then
+		State.batch_execution = { total = #queue, current = 0, start_time = os.time() }
+		for _, item in ipairs(queue) do
+			M.send_payload(item.code, item.id, fn)
+		end
+	end
+end
+
+function M.run_all_cells()
+	if not is_window_open() then
+		return vim.notify("Jovian windows are closed.", vim.log.levels.WARN)
+	end
+	local src_win = vim.api.nvim_get_current_win()
+	vim.api.nvim_set_current_win(src_win)
+	if not State.job_id then
+		M.start_kernel()
+	end
+	local fn = vim.fn.expand("%:t")
+	if fn == "" then
+		fn = "untitled"
+	end
+	local lines = vim.api.nvim_buf_get_lines(0, 0, -1, false)
+	run_queue(collect_code_cells(lines), fn)
 end
 
 function M.run_cells_above()
@@ -468,38 +541,66 @@ function M.run_cells_above()
 		fn = "untitled"
 	end
 
-    local cursor_line = vim.fn.line(".")
-    local _, end_line = Cell.get_cell_range(cursor_line)
+	local cursor_line = vim.fn.line(".")
+	local _, end_line = Cell.get_cell_range(cursor_line)
 	local lines = vim.api.nvim_buf_get_lines(0, 0, end_line, false)
-    
-	local blk, bid, is_code = {}, "scratchpad", true
-    local queue = {}
+	run_queue(collect_code_cells(lines), fn)
+end
 
-	for i, line in ipairs(lines) do
-		if line:match("^# %%%%") then
-			if #blk > 0 and is_code then
-                table.insert(queue, { code = table.concat(blk, "\n"), id = bid })
-			end
-			blk, bid = {}, Cell.ensure_cell_id(i, line)
-			is_code = not line:lower():match("^# %%%%+%s*%[markdown%]")
-		else
-			if is_code then
-				table.insert(blk, line)
-			end
-		end
+-- Re-runs cells that changed (or did not finish) since their last run, plus the
+-- cells downstream of them; the bridge works out the dependencies
+function M.run_stale_cells()
+	if not is_window_open() then
+		return vim.notify("Jovian windows are closed.", vim.log.levels.WARN)
 	end
-	if #blk > 0 and is_code then
-        table.insert(queue, { code = table.concat(blk, "\n"), id = bid })
+	-- A fresh kernel has nothing worth keeping
+	if not State.job_id then
+		return M.run_all_cells()
+	end
+	local fn = vim.fn.expand("%:t")
+	if fn == "" then
+		fn = "untitled"
 	end
 
-    if #queue > 0 then
-        State.batch_execution = { total = #queue, current = 0, start_time = os.time() }
-        for _, item in ipairs(queue) do
-            M.send_payload(item.code, item.id, fn)
-        end
-    end
+	local bufnr = vim.api.nvim_get_current_buf()
+	local queue = collect_code_cells(vim.api.nvim_buf_get_lines(bufnr, 0, -1, false))
+	local cells, stale = {}, {}
+	for _, item in ipairs(queue) do
+		table.insert(cells, { id = item.id, code = item.code })
+		local mark = item.line and UI.get_cell_status_extmark(bufnr, item.line)
+		if State.cell_hashes[item.id] ~= Cell.get_cell_hash(item.code) or not (mark and mark.status == "done") then
+			table.insert(stale, item.id)
+		end
+	end
+	M.send_command(
+		{ command = "plan_stale", cells = cells, stale = stale },
+		{ queue = queue, bufnr = bufnr, filename = fn }
+	)
+end
+
+-- Runs the cells the bridge picked, from the buffer they were collected in
+function M.run_plan(request, ids)
+	if not vim.api.nvim_buf_is_valid(request.bufnr) then
+		return
+	end
+	local selected = {}
+	for _, id in ipairs(ids or {}) do
+		selected[id] = true
+	end
+	local queue = vim.tbl_filter(function(item)
+		return selected[item.id]
+	end, request.queue)
+	if #queue == 0 then
+		return vim.notify("No stale cells", vim.log.levels.INFO)
+	end
+	vim.notify(("Re-running %d of %d cells"):format(#queue, #request.queue), vim.log.levels.INFO)
+	vim.api.nvim_buf_call(request.bufnr, function()
+		run_queue(queue, request.filename)
+	end)
 end
 
+local DF_PAGE_COLS = 20
+
 function M.view_dataframe(args)
 	if not State.job_id then
         M.start_kernel(function()
@@ -511,8 +612,30 @@ function M.view_dataframe(args)
 	if var_name == "" then
 		var_name = vim.fn.expand("<cword>")
 	end
-	local msg = vim.json.encode({ command = "view_dataframe", name = var_name })
-	vim.api.nvim_chan_send(State.job_id, msg .. "\n")
+	-- Only the page that fits the float is requested; the rest stays in the kernel
+	local limit = math.max(math.floor(vim.o.lines * 0.8) - 3, 10)
+	M.send_command({ command = "view_dataframe", name = var_name, limit = limit, col_limit = DF_PAGE_COLS }, {})
+end
+
+-- Requests another window of an open DataFrame view. changes override the view's
+-- offset/col_offset/sort/filter (sort = false and filter = "" clear them).
+function M.dataframe_page(view, changes)
+	local cmd = {
+		command = "df_page",
+		view_id = view.view_id,
+		offset = view.offset,
+		limit = view.limit,
+		col_offset = view.col_offset,
+		col_limit = view.col_limit,
+		sort = view.sort,
+		filter = view.filter,
+	}
+	M.send_command(vim.tbl_extend("force", cmd, changes or {}), {})
+end
+
+function M.dataframe_close(view_id)
+	State.dataframe_views[view_id] = nil
+	M.send_command({ command = "df_close", view_id = view_id })
 end
 
 function M.show_variables(opts)
@@ -522,18 +645,33 @@ function M.show_variables(opts)
         end)
 		return
 	end
-    
-    if opts and opts.force_float then
-        State.vars_request_force_float = true
-    end
 
-	local msg = vim.json.encode({ command = "get_variables" })
+
     -- UI.append_to_repl("[Jovian] Requesting variables...", "Comment")
-	vim.api.nvim_chan_send(State.job_id, msg .. "\n")
+	M.send_command(
+		{ command = "get_variables", snapshot = State.variables.snapshot },
+		{ force_float = opts and opts.force_float or false }
+	)
 end
 
 
 
+-- Stops the kernel. In daemon mode detaching (closing Neovim) keeps it
+-- running, so this is how a session is ended.
+function M.shutdown_kernel()
+	if not State.job_id then
+		return vim.notify("Kernel not running", vim.log.levels.WARN)
+	end
+	if Config.options.daemon and Config.options.daemon.enabled then
+		-- The daemon closes the session's clients, which ends our relay job
+		M.send_command({ command = "shutdown" })
+	else
+		vim.fn.jobstop(State.job_id)
+	end
+	UI.clear_status_extmarks(0)
+	UI.append_to_repl("[Kernel Shutdown]", "WarningMsg")
+end
+
 function M.interrupt_kernel()
 	if not State.job_id then
 		return vim.notify("Kernel not running", vim.log.levels.WARN)
@@ -572,8 +710,7 @@ function M.inspect_object(args)
 		var_name = vim.fn.expand("<cword>")
 	end
 
-	local msg = vim.json.encode({ command = "inspect", name = var_name })
-	vim.api.nvim_chan_send(State.job_id, msg .. "\n")
+	M.send_command({ command = "inspect", name = var_name }, {})
 end
 
 function M.peek_symbol(args)
@@ -588,8 +725,7 @@ function M.peek_symbol(args)
 		var_name = vim.fn.expand("<cword>")
 	end
 
-	local msg = vim.json.encode({ command = "peek", name = var_name })
-	vim.api.nvim_chan_send(State.job_id, msg .. "\n")
+	M.send_command({ command = "peek", name = var_name }, {})
 end
 
 
@@ -4,10 +4,51 @@ local Config = require("jovian.config")
 local State = require("jovian.state")
 local Session = require("jovian.session")
 
+-- Keeps the variables pane live while cells run
+local vars_timer = nil
+
+local function variables_pane_open()
+	return State.win.variables and vim.api.nvim_win_is_valid(State.win.variables)
+end
+
+local function start_vars_refresh()
+	local interval = Config.options.variables_refresh_ms
+	if vars_timer or not interval or interval <= 0 then
+		return
+	end
+	vars_timer = vim.loop.new_timer()
+	vars_timer:start(
+		interval,
+		interval,
+		vim.schedule_wrap(function()
+			-- Skip while the previous refresh is still in flight
+			if not variables_pane_open() or State.vars_refresh_request then
+				return
+			end
+			State.vars_refresh_request = require("jovian.core").send_command(
+				{ command = "get_variables", snapshot = State.variables.snapshot },
+				{}
+			)
+		end)
+	)
+end
+
+local function stop_vars_refresh()
+	if vars_timer then
+		vars_timer:stop()
+		vars_timer:close()
+		vars_timer = nil
+	end
+end
+
 function M.handle_stream(msg)
 	UI.append_stream_text(msg.text, msg.stream)
 end
 
+function M.handle_stream_batch(msg)
+	UI.append_stream_batch(msg.chunks)
+end
+
 function M.handle_image_saved(msg)
 	UI.append_to_repl("[Image Created]: " .. vim.fn.fnamemodify(msg.path, ":t"), "Special")
 end
@@ -17,6 +58,18 @@ function M.handle_debug(msg)
 end
 
 function M.handle_ready(msg)
+	-- Send settings first so they apply to executions queued by the callbacks
+	local configure_msg = vim.json.encode({
+		command = "configure",
+		output = Config.options.output,
+		kernel_pool = Config.options.kernel_pool,
+		cell_cache = Config.options.cell_cache,
+		telemetry = Config.options.telemetry,
+		figures = Config.options.figures,
+		protocol = Config.options.bridge_protocol,
+	})
+	vim.api.nvim_chan_send(State.job_id, configure_msg .. "\n")
+
 	-- Execute all registered callbacks
 	for _, callback in ipairs(State.on_ready_callbacks) do
 		callback()
@@ -35,7 +88,13 @@ function M.handle_ready(msg)
 	end
 end
 
+function M.handle_protocol(msg)
+	-- The bridge frames everything after this message with the agreed version
+	State.bridge_protocol = msg.version
+end
+
 function M.handle_execution_started(msg)
+	start_vars_refresh()
 	UI.append_to_repl({ "In [" .. msg.cell_id .. "]:" }, "Type")
 	local code_lines = vim.split(msg.code, "\n")
 	local indented = {}
@@ -46,12 +105,63 @@ function M.handle_execution_started(msg)
 	UI.append_to_repl({ "" })
 end
 
+local function format_bytes(n)
+	local sign = n < 0 and "-" or "+"
+	n = math.abs(n)
+	if n >= 1024 * 1024 * 1024 then
+		return string.format("%s%.1fGB", sign, n / (1024 * 1024 * 1024))
+	end
+	return string.format("%s%dMB", sign, math.floor(n / (1024 * 1024) + 0.5))
+end
+
+-- " [2.31s, cpu 2.20s, +120MB rss, waited 1.2s, was 1.20s]"; small numbers are left out
+local function format_telemetry(t)
+	if not t.wall then
+		return ""
+	end
+	if t.cached then
+		-- The wall of a cache hit is the lookup; previous_wall is the last real run
+		local text = string.format(" [cached %.2fs", t.wall)
+		if t.previous_wall then
+			text = text .. string.format(", ran %.2fs", t.previous_wall)
+		end
+		return text .. "]"
+	end
+	local parts = { string.format("%.2fs", t.wall) }
+	local cpu = (t.cpu_user or 0) + (t.cpu_sys or 0)
+	if cpu >= 0.01 then
+		table.insert(parts, string.format("cpu %.2fs", cpu))
+	end
+	local mb = 1024 * 1024
+	if (t.rss_peak_delta or 0) >= mb then
+		table.insert(parts, format_bytes(t.rss_peak_delta) .. " rss")
+	end
+	if t.tracemalloc_peak then
+		table.insert(parts, format_bytes(t.tracemalloc_peak):sub(2) .. " py peak")
+	end
+	if math.abs(t.gpu_free_delta or 0) >= mb then
+		-- Less free GPU memory means the cell allocated some
+		table.insert(parts, format_bytes(-t.gpu_free_delta) .. " gpu")
+	end
+	if (t.queue_wait or 0) >= 0.1 then
+		table.insert(parts, string.format("waited %.1fs", t.queue_wait))
+	end
+	-- Only worth pointing out when the cell got noticeably faster or slower
+	local prev = t.previous_wall
+	if prev and math.abs(t.wall - prev) > 0.2 * math.max(prev, 0.05) then
+		table.insert(parts, string.format("was %.2fs", prev))
+	end
+	return " [" .. table.concat(parts, ", ") .. "]"
+end
+
 function M.handle_result_ready(msg)
+	require("jovian.core").take_request(msg)
 	State.current_preview_file = nil
 
-	Session.save_execution_result(msg)
-
-	UI.open_markdown_preview(msg.file)
+	-- Remote outputs arrive asynchronously; preview once they are local
+	Session.save_execution_result(msg, function()
+		UI.open_markdown_preview(msg.file)
+	end)
 	UI.update_variables_pane()
 
 	local target_buf = State.cell_buf_map[msg.cell_id]
@@ -85,6 +195,11 @@ function M.handle_result_ready(msg)
 		if Config.options.show_execution_time then
 			timestamp = " (" .. os.date("%H:%M:%S") .. ")"
 		end
+		if Config.options.telemetry.show and msg.telemetry then
+			timestamp = timestamp .. format_telemetry(msg.telemetry)
+		elseif msg.cached then
+			timestamp = timestamp .. " (cached)"
+		end
 
 		if msg.error or msg.status == "error" then
 			UI.send_notification("Error in cell " .. msg.cell_id, "error")
@@ -112,44 +227,120 @@ function M.handle_result_ready(msg)
 	State.cell_buf_map[msg.cell_id] = nil
 	State.cell_start_time[msg.cell_id] = nil
 	State.cell_start_line[msg.cell_id] = nil
+
+	if vim.tbl_isempty(State.cell_buf_map) then
+		stop_vars_refresh()
+	end
+end
+
+function M.handle_figure_files(msg)
+	require("jovian.core").take_request(msg)
+	if #msg.paths == 0 then
+		return vim.notify("No thumbnailed figures of this cell are left in the kernel", vim.log.levels.WARN)
+	end
+	local function open_all()
+		for _, path in ipairs(msg.paths) do
+			UI.open_file(path)
+		end
+	end
+	if Config.options.ssh_host then
+		Session.fetch_remote_files(msg.paths, open_all)
+	else
+		open_all()
+	end
+end
+
+function M.handle_file_data(msg)
+	local request = msg.done and require("jovian.core").take_request(msg)
+	Session.receive_remote_files(msg, request)
 end
 
 function M.handle_variable_list(msg)
 	-- vim.notify("Received variables: " .. #msg.variables, vim.log.levels.INFO)
-	UI.show_variables(msg.variables, require("jovian.state").vars_request_force_float)
-	require("jovian.state").vars_request_force_float = false
+	local request = require("jovian.core").take_request(msg)
+	if msg.request_id and msg.request_id == State.vars_refresh_request then
+		State.vars_refresh_request = nil
+	end
+	local force_float = request and request.force_float
+
+	-- The reply is a diff against the snapshot we sent; resync if it no longer matches
+	local vars = State.variables
+	if not msg.reset and msg.base ~= vars.snapshot then
+		vars.snapshot = nil
+		require("jovian.core").show_variables({ force_float = force_float })
+		return
+	end
+	if msg.reset then
+		vars.entries = {}
+	end
+	for _, v in ipairs(msg.changed or {}) do
+		vars.entries[v.name] = v
+	end
+	for _, name in ipairs(msg.removed or {}) do
+		vars.entries[name] = nil
+	end
+	vars.snapshot = msg.snapshot
+
+	local list = vim.tbl_values(vars.entries)
+	table.sort(list, function(a, b)
+		return a.name < b.name
+	end)
+	UI.show_variables(list, force_float)
 end
 
 function M.handle_dataframe_data(msg)
-	UI.show_dataframe(msg)
+	local request = require("jovian.core").take_request(msg)
+	if msg.error then
+		vim.notify("[Jovian] " .. msg.error, vim.log.levels.WARN)
+	end
+	UI.show_dataframe(msg, request and request.command == "view_dataframe")
+end
+
+function M.handle_run_plan(msg)
+	local request = require("jovian.core").take_request(msg)
+	if request then
+		require("jovian.core").run_plan(request, msg.cells)
+	end
 end
 
 function M.handle_profile_stats(msg)
-	UI.show_profile_stats(msg.text)
+	UI.show_profile_stats(msg)
 end
 
 function M.handle_inspection_data(msg)
+	require("jovian.core").take_request(msg)
 	UI.show_inspection(msg.data)
 end
 
 function M.handle_peek_data(msg)
+	require("jovian.core").take_request(msg)
 	UI.show_peek(msg.data or msg)
 end
 
 function M.handle_clipboard_data(msg)
+	require("jovian.core").take_request(msg)
 	vim.fn.setreg("+", msg.content)
 	vim.notify("Copied to system clipboard!", vim.log.levels.INFO)
 end
 
 function M.handle_input_request(msg)
 	UI.append_to_repl("[Input Requested]: " .. msg.prompt, "Special")
-	vim.ui.input({ prompt = msg.prompt }, function(input)
+	local function reply(input)
 		local value = input or ""
-		UI.append_to_repl(value)
 		if State.job_id then
-			local reply = vim.json.encode({ command = "input_reply", value = value })
-			vim.fn.chansend(State.job_id, reply .. "\n")
+			local reply_msg = vim.json.encode({ command = "input_reply", value = value })
+			vim.fn.chansend(State.job_id, reply_msg .. "\n")
 		end
+		return value
+	end
+
+	-- getpass(): don't echo the value into the REPL
+	if msg.password then
+		reply(vim.fn.inputsecret(msg.prompt))
+		return
+	end
+	vim.ui.input({ prompt = msg.prompt }, function(input)
+		UI.append_to_repl(reply(input))
 	end)
 end
 
@@ -10,6 +10,44 @@ function M.ensure_hosts_dir()
 	end
 end
 
+-- SSH connection sharing: ssh/scp calls to a host reuse one master connection,
+-- so only the first one pays for the handshake
+local function control_options()
+	local persist = Config.options.ssh_control_persist
+	if persist == false then
+		return {}
+	end
+	local dir = vim.fn.stdpath("cache") .. "/jovian"
+	if vim.fn.isdirectory(dir) == 0 then
+		vim.fn.mkdir(dir, "p")
+	end
+	return {
+		"-o",
+		"ControlMaster=auto",
+		"-o",
+		"ControlPath=" .. dir .. "/ssh-%C",
+		"-o",
+		"ControlPersist=" .. (persist or "10m"),
+	}
+end
+
+local function transport_options()
+	local opts = control_options()
+	if Config.options.ssh_compression then
+		vim.list_extend(opts, { "-o", "Compression=yes" })
+	end
+	return opts
+end
+
+function M.ssh_command(host, remote_cmd, ssh_opts)
+	local cmd = { "ssh" }
+	vim.list_extend(cmd, transport_options())
+	vim.list_extend(cmd, ssh_opts or {})
+	table.insert(cmd, host)
+	vim.list_extend(cmd, remote_cmd or {})
+	return cmd
+end
+
 function M.load_hosts()
 	local data
 	if vim.fn.filereadable(M.hosts_file) == 0 then
@@ -102,7 +140,7 @@ function M.use_host(name)
 	local Core = require("jovian.core")
 	local State = require("jovian.state")
 	if State.job_id then
-		Core.restart_kernel()
+		Core.restart_kernel({ full = true })
 	end
 end
 
@@ -147,38 +185,24 @@ function M.validate_connection(config, on_success, on_error)
 			end,
 		})
 	elseif host then
-		-- Check SSH connectivity
+		-- Connectivity and the remote interpreter in one round trip
 		vim.notify("[Jovian] Validating connection to " .. host .. "...", vim.log.levels.INFO)
 
-		vim.fn.jobstart({ "ssh", "-o", "BatchMode=yes", "-o", "ConnectTimeout=5", host, "exit" }, {
+		local cmd = M.ssh_command(host, { python, "--version" }, { "-o", "BatchMode=yes", "-o", "ConnectTimeout=5" })
+		vim.fn.jobstart(cmd, {
 			on_exit = function(_, code)
-				if code ~= 0 then
-					if on_error then
+				if code == 0 then
+					if on_success then
+						on_success()
+					end
+				elseif on_error then
+					-- ssh itself exits with 255 when it cannot connect
+					if code == 255 then
 						on_error("Could not connect to " .. host .. ". Check SSH config/keys.")
+					else
+						on_error("Python interpreter '" .. python .. "' not found or not executable on " .. host .. ".")
 					end
-					return
 				end
-
-				-- Check remote python
-				vim.fn.jobstart({ "ssh", host, python, "--version" }, {
-					on_exit = function(_, py_code)
-						if py_code ~= 0 then
-							if on_error then
-								on_error(
-									"Python interpreter '"
-										.. python
-										.. "' not found or not executable on "
-										.. host
-										.. "."
-								)
-							end
-						else
-							if on_success then
-								on_success()
-							end
-						end
-					end,
-				})
 			end,
 		})
 	else
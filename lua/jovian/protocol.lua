@@ -0,0 +1,95 @@
+-- Reader for the bridge's output stream.
+-- Protocol 1 is one JSON document per line; protocol 2 frames each message as
+-- "@<bytes>:<json>". Anything that is not a frame is read as a line, so both
+-- can appear in one stream and the switch after negotiation needs no sync.
+-- Chunks are only joined once they can complete a line or frame, which keeps
+-- reading linear in the message size however finely it was split.
+local M = {}
+
+-- Highest version this reader understands; sent with "configure"
+M.VERSION = 2
+
+local AT = string.byte("@")
+local NL = string.byte("\n")
+
+function M.new_reader()
+	return {
+		parts = {}, -- Buffered chunks, joined lazily
+		size = 0, -- Total bytes in parts
+		need = nil, -- Payload bytes of the frame whose header was consumed
+	}
+end
+
+local function decode(text)
+	local ok, msg = pcall(vim.fn.json_decode, text)
+	if ok and type(msg) == "table" then
+		return msg
+	end
+	return { raw = text }
+end
+
+-- Parses every complete line/frame in the buffer and keeps the remainder
+local function drain(reader, msgs)
+	local buf = table.concat(reader.parts)
+	local pos, len = 1, #buf
+	while pos <= len do
+		if reader.need then
+			if len - pos + 1 < reader.need then
+				break
+			end
+			msgs[#msgs + 1] = decode(buf:sub(pos, pos + reader.need - 1))
+			pos = pos + reader.need
+			reader.need = nil
+		else
+			local byte = buf:byte(pos)
+			local header, size
+			if byte == AT then
+				header, size = buf:match("^(@(%d+):)", pos)
+			end
+			if byte == NL then
+				pos = pos + 1
+			elseif header then
+				reader.need = tonumber(size)
+				pos = pos + #header
+			elseif byte == AT and buf:find("^@%d*$", pos) then
+				-- Frame header split across chunks
+				break
+			else
+				local eol = buf:find("\n", pos, true)
+				if not eol then
+					break
+				end
+				msgs[#msgs + 1] = decode(buf:sub(pos, eol - 1))
+				pos = eol + 1
+			end
+		end
+	end
+	local rest = pos <= len and buf:sub(pos) or ""
+	reader.parts = rest ~= "" and { rest } or {}
+	reader.size = #rest
+end
+
+-- Feeds one on_stdout/on_stderr data list; returns the completed messages
+function M.feed(reader, data)
+	local msgs = {}
+	-- Job output arrives split on newlines; joining the items restores the chunk
+	local chunk = table.concat(data, "\n")
+	if chunk == "" then
+		return msgs
+	end
+	reader.parts[#reader.parts + 1] = chunk
+	reader.size = reader.size + #chunk
+
+	if reader.need then
+		if reader.size < reader.need then
+			return msgs
+		end
+	elseif #data == 1 and reader.parts[1]:byte(1) ~= AT then
+		-- Still inside a line
+		return msgs
+	end
+	drain(reader, msgs)
+	return msgs
+end
+
+return M
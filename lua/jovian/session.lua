@@ -4,6 +4,95 @@ local Config = require("jovian.config")
 local UI = require("jovian.ui")
 local Cell = require("jovian.cell")
 
+-- Replayed index.jsonl per cache dir (see OutputStore in kernel_bridge.py).
+-- Only records appended since the last look are read.
+local indexes = {}
+
+local function apply_index_record(index, rec)
+	local old = index.cells[rec.cell]
+	if old then
+		for _, b in ipairs(old.blobs or {}) do
+			index.refs[b] = (index.refs[b] or 1) - 1
+		end
+		index.cells[rec.cell] = nil
+	end
+	if rec.op == "set" then
+		index.cells[rec.cell] = rec
+		for _, b in ipairs(rec.blobs or {}) do
+			index.refs[b] = (index.refs[b] or 0) + 1
+		end
+	end
+end
+
+local function load_index(cache_dir)
+	local path = cache_dir .. "/index.jsonl"
+	local stat = vim.loop.fs_stat(path)
+	if not stat then
+		return nil
+	end
+
+	local index = indexes[cache_dir]
+	-- The backend compacts by replacing the file; start over when that happens
+	if not index or index.ino ~= stat.ino or stat.size < index.offset then
+		index = { ino = stat.ino, offset = 0, cells = {}, refs = {} }
+		indexes[cache_dir] = index
+	end
+	if stat.size == index.offset then
+		return index
+	end
+
+	local f = io.open(path, "rb")
+	if not f then
+		return nil
+	end
+	f:seek("set", index.offset)
+	local data = f:read("*a")
+	f:close()
+
+	-- A partially written record is left for the next look
+	local last = data:match(".*()\n")
+	if last then
+		for line in data:sub(1, last):gmatch("[^\n]+") do
+			local ok, rec = pcall(vim.json.decode, line)
+			if ok and type(rec) == "table" and rec.cell then
+				apply_index_record(index, rec)
+			end
+		end
+		index.offset = index.offset + last
+	end
+	return index
+end
+
+-- Drops cells from the index along with their files and any blobs left unreferenced
+local function drop_index_cells(cache_dir, index, ids)
+	local records = {}
+	local released = {}
+	for _, id in ipairs(ids) do
+		local entry = index.cells[id]
+		if entry then
+			table.insert(records, vim.json.encode({ op = "drop", cell = id }))
+			for _, f in ipairs(entry.files or {}) do
+				vim.fn.delete(cache_dir .. "/" .. f)
+			end
+			for _, b in ipairs(entry.blobs or {}) do
+				table.insert(released, b)
+			end
+		end
+	end
+	if #records == 0 then
+		return
+	end
+
+	vim.fn.writefile(records, cache_dir .. "/index.jsonl", "a")
+	index = load_index(cache_dir) or index
+
+	for _, b in ipairs(released) do
+		if (index.refs[b] or 0) <= 0 then
+			vim.fn.delete(cache_dir .. "/" .. b)
+		end
+	end
+end
+
 function M.clean_stale_cache(bufnr)
 	-- Handle command opts table or nil
 	if type(bufnr) == "table" or not bufnr then
@@ -35,6 +124,19 @@ function M.clean_stale_cache(bufnr)
 		return
 	end
 
+	-- Indexed caches are cleaned through the index; older ones by parsing filenames
+	local index = load_index(cache_dir)
+	if index then
+		local stale = {}
+		for id, _ in pairs(index.cells) do
+			if not valid_ids_set[id] then
+				table.insert(stale, id)
+			end
+		end
+		drop_index_cells(cache_dir, index, stale)
+		return
+	end
+
 	local files = vim.fn.readdir(cache_dir)
 	local deleted_count = 0
 
@@ -42,6 +144,9 @@ function M.clean_stale_cache(bufnr)
 		local file_id = nil
 		if f:match("%.md$") then
 			file_id = f:sub(1, -4)
+		elseif f:match("%.log$") then
+			-- Spilled output log: ID.log
+			file_id = f:sub(1, -5)
 		elseif f:match("%.png$") then
 			-- Try matching timestamped format: ID_timestamp_counter.png
 			file_id = f:match("^(.*)_%d+_%d+%.png$")
@@ -103,6 +208,14 @@ function M.clear_all_cache()
 	vim.notify("Cleared all cache", vim.log.levels.INFO)
 end
 
+-- dir -> mtimes of dir and its cache root at the last orphan check
+local orphan_checks = {}
+
+local function mtime_key(path)
+	local stat = vim.loop.fs_stat(path)
+	return stat and (stat.mtime.sec .. "." .. stat.mtime.nsec) or ""
+end
+
 function M.clean_orphaned_caches(dir)
 	dir = dir or vim.fn.getcwd()
 	local cache_root = dir .. "/.jovian_cache"
@@ -111,6 +224,12 @@ function M.clean_orphaned_caches(dir)
 		return
 	end
 
+	-- Removing a source file touches dir and a new cache touches cache_root,
+	-- so there is nothing to do while both are unchanged
+	if orphan_checks[dir] == mtime_key(dir) .. ":" .. mtime_key(cache_root) then
+		return
+	end
+
 	-- Iterate over directories in .jovian_cache
 	local scanner = vim.loop.fs_scandir(cache_root)
 	if scanner then
@@ -133,6 +252,8 @@ function M.clean_orphaned_caches(dir)
 			end
 		end
 	end
+
+	orphan_checks[dir] = mtime_key(dir) .. ":" .. mtime_key(cache_root)
 end
 
 function M.check_structure_change()
@@ -237,26 +358,138 @@ function M.check_cursor_cell()
 	end)
 end
 
-function M.sync_remote_file(remote_path)
-	if not Config.options.ssh_host then
+local B64_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+local B64 = {}
+for i = 1, #B64_CHARS do
+	B64[B64_CHARS:byte(i)] = i - 1
+end
+
+-- vim.base64 only exists from Neovim 0.10
+local function decode_base64(text)
+	if vim.base64 then
+		return vim.base64.decode(text)
+	end
+	text = text:gsub("[^%w%+/]", "")
+	local out = {}
+	for i = 1, #text, 4 do
+		local a, b, c, d = text:byte(i, i + 3)
+		local n = B64[a] * 262144 + B64[b] * 4096 + (c and B64[c] or 0) * 64 + (d and B64[d] or 0)
+		local bytes = string.char(math.floor(n / 65536), math.floor(n / 256) % 256, n % 256)
+		out[#out + 1] = bytes:sub(1, d and 3 or (c and 2 or 1))
+	end
+	return table.concat(out)
+end
+
+local function write_file(path, data)
+	vim.fn.mkdir(vim.fn.fnamemodify(path, ":h"), "p")
+	local tmp = path .. ".tmp"
+	local f = io.open(tmp, "wb")
+	if not f then
+		return false
+	end
+	f:write(data)
+	f:close()
+	return os.rename(tmp, path)
+end
+
+-- Remote outputs come back over the bridge's own channel (fetch_files).
+-- Paths requested while a fetch is in flight are sent together once it
+-- completes, so a run of quick cells costs one round trip per batch.
+local function flush_remote_fetch()
+	local fetch = State.remote_fetch
+	if fetch.in_flight or #fetch.callbacks == 0 then
 		return
 	end
+	local paths, callbacks = fetch.paths, fetch.callbacks
+	fetch.paths, fetch.queued, fetch.callbacks = {}, {}, {}
+
+	local hashes = {}
+	for _, path in ipairs(paths) do
+		-- Only claim the content we have if the local copy is still there
+		if State.remote_hashes[path] and vim.fn.filereadable(path) == 1 then
+			hashes[path] = State.remote_hashes[path]
+		end
+	end
+	local request_id = #paths > 0
+		and require("jovian.core").send_command(
+			{ command = "fetch_files", paths = paths, hashes = hashes },
+			{ callbacks = callbacks }
+		)
+	if request_id then
+		fetch.in_flight = true
+		return
+	end
+	for _, callback in ipairs(callbacks) do
+		callback()
+	end
+end
 
-	local host = Config.options.ssh_host
-	local local_path = remote_path -- We assume paths match because we sent the local path as file_dir
+-- Copies remote output files to the same paths locally, then calls callback
+function M.fetch_remote_files(paths, callback)
+	local fetch = State.remote_fetch
+	for _, path in ipairs(paths) do
+		if not fetch.queued[path] then
+			fetch.queued[path] = true
+			table.insert(fetch.paths, path)
+		end
+	end
+	table.insert(fetch.callbacks, callback)
+	flush_remote_fetch()
+end
 
-	-- Ensure local directory exists
-	local dir = vim.fn.fnamemodify(local_path, ":h")
-	vim.fn.mkdir(dir, "p")
+-- Appends one part of a fetched file; the final part replaces the file
+local function write_part(file)
+	local offset = file.offset or 0
+	local tmp = file.path .. ".part"
+	if offset == 0 then
+		vim.fn.mkdir(vim.fn.fnamemodify(file.path, ":h"), "p")
+	end
+	local f = io.open(tmp, offset == 0 and "wb" or "ab")
+	if not f then
+		return false
+	end
+	-- A part that does not continue the file means an earlier one was lost
+	if f:seek("end") ~= offset then
+		f:close()
+		os.remove(tmp)
+		return false
+	end
+	f:write(decode_base64(file.data))
+	f:close()
+	return file.final ~= false and os.rename(tmp, file.path)
+end
 
-	local cmd = string.format("scp %s:%s %s", host, remote_path, local_path)
-	vim.fn.system(cmd)
+-- Writes one file_data reply; the last one completes the fetch
+function M.receive_remote_files(msg, request)
+	for _, file in ipairs(msg.files or {}) do
+		if write_part(file) then
+			State.remote_hashes[file.path] = file.sha256
+		end
+	end
+	if not msg.done then
+		return
+	end
+	State.remote_fetch.in_flight = false
+	for _, callback in ipairs(request and request.callbacks or {}) do
+		callback()
+	end
+	flush_remote_fetch()
 end
 
-function M.save_execution_result(msg)
+-- Brings the cell's output files local, then calls on_ready
+function M.save_execution_result(msg, on_ready)
+	on_ready = on_ready or function() end
+	local remote_paths
 	if Config.options.ssh_host then
-		M.sync_remote_file(msg.file)
-		-- Images are handled by base64 writing below or implicit sync if they were files
+		-- We sent the local path as file_dir, so remote and local paths match
+		remote_paths = { msg.file, msg.file .. ".idx" }
+		-- Images are written next to the markdown on the remote; only their paths are sent
+		for _, img in pairs(msg.images or {}) do
+			-- Blobs are named by content hash, so a local copy is already up to date
+			if type(img) == "table" and img.path and vim.fn.filereadable(img.path) == 0 then
+				table.insert(remote_paths, img.path)
+			end
+		end
 	end
 
 	-- Sync content to local cache if provided (SSH or Local)
@@ -275,24 +508,25 @@ function M.save_execution_result(msg)
 		-- Write Images
 		if msg.images then
 			for img_name, b64 in pairs(msg.images) do
-				local img_path = cache_dir .. "/" .. img_name
-				local write_script = string.format(
-					"import base64, sys; open('%s', 'wb').write(base64.b64decode(sys.stdin.read()))",
-					img_path
-				)
-				vim.fn.system({ Config.options.python_interpreter, "-c", write_script }, b64)
+				-- Entries are path metadata now; only legacy inline base64 needs writing
+				if type(b64) == "string" then
+					write_file(cache_dir .. "/" .. img_name, decode_base64(b64))
+				end
 			end
 		end
 
 		-- Write MD
 		local md_path = cache_dir .. "/" .. cell_id .. ".md"
-		local f = io.open(md_path, "w")
-		if f then
-			f:write(msg.content_md)
-			f:close()
+		if write_file(md_path, msg.content_md) then
 			msg.file = md_path -- Update to local path
 		end
 	end
+
+	if remote_paths then
+		M.fetch_remote_files(remote_paths, on_ready)
+	else
+		on_ready()
+	end
 end
 
 return M
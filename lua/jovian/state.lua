@@ -29,8 +29,20 @@ M.cell_status_extmarks = {} -- { [cell_id] = extmark_id }
 M.cell_hashes = {} -- { [cell_id] = hash_string }
 M.cell_start_line = {} -- { cell_id: line_num }
 
+M.bridge_protocol = nil -- Output protocol version the bridge agreed to
 M.on_ready_callbacks = {} -- List of functions to call when kernel is ready
 
+-- Backend requests
+M.request_seq = 0
+M.pending_requests = {} -- { [request_id] = { command = string, ...opts } }
+M.vars_refresh_request = nil -- request_id of the in-flight periodic variables refresh
+M.variables = { snapshot = nil, entries = {} } -- Kernel snapshot the variables diffs apply to
+M.dataframe_views = {} -- { [view_id] = { buf, win, offset, limit, col_offset, col_limit, sort, filter, ... } }
+
+-- Remote output transfer (see Session.fetch_remote_files)
+M.remote_fetch = { paths = {}, queued = {}, callbacks = {}, in_flight = false }
+M.remote_hashes = {} -- { [path] = sha256 of the copy fetched last }
+
 M.batch_execution = nil -- { total = int, current = int, start_time = timestamp }
 
 return M
@@ -37,8 +37,10 @@ M.delete_status_extmark = VirtualText.delete_status_extmark
 M.clear_diagnostics = VirtualText.clear_diagnostics
 
 M.send_notification = Shared.send_notification
+M.open_file = Shared.open_file
 M.append_to_repl = Shared.append_to_repl
 M.append_stream_text = Shared.append_stream_text
+M.append_stream_batch = Shared.append_stream_batch
 
 function M.clear_repl()
 	if State.buf.output and vim.api.nvim_buf_is_valid(State.buf.output) then
@@ -0,0 +1,194 @@
+-- Paged preview of large cell outputs.
+-- The bridge writes <id>.md.idx next to outputs over ~1000 lines: the byte
+-- offset of every `step`-th line and the code fence open at it. A paged
+-- buffer holds the first and last pages with a gap line between them;
+-- whenever the gap scrolls into view the next page is read from disk, so
+-- neither loading nor highlighting ever touches the whole file.
+local M = {}
+local Config = require("jovian.config")
+
+local group = vim.api.nvim_create_augroup("JovianPager", { clear = true })
+
+-- { [buf] = { path, index, head, tail, gap } }
+-- head: file lines shown from the top; tail: first file line of the bottom
+-- page; gap: buffer lines between them (fence close, marker, fence reopen)
+local pages = {}
+
+local function is_fence(line)
+	return line:match("^%s*```") ~= nil
+end
+
+-- Returns the index if it still describes the file at path
+function M.read_index(path)
+	local f = io.open(path .. ".idx", "r")
+	if not f then
+		return nil
+	end
+	local ok, index = pcall(vim.json.decode, f:read("*a"))
+	f:close()
+	if not ok or type(index) ~= "table" or vim.fn.getfsize(path) ~= index.bytes then
+		return nil
+	end
+	return index
+end
+
+-- Lines [first, last) of the file (0-based) and the fence open before each end
+local function read_lines(path, index, first, last)
+	local k = math.floor(first / index.step)
+	local fence = index.fences[k + 1]
+	if fence == vim.NIL then
+		fence = nil
+	end
+	local f = io.open(path, "rb")
+	if not f then
+		return {}, nil, nil
+	end
+	f:seek("set", index.offsets[k + 1])
+	local lines = {}
+	local before
+	for n = k * index.step, last - 1 do
+		if n == first then
+			before = fence
+		end
+		local line = f:read("*l")
+		if not line then
+			break
+		end
+		if n >= first then
+			lines[#lines + 1] = line
+		end
+		if is_fence(line) then
+			fence = not fence and line or nil
+		end
+	end
+	f:close()
+	if first == last then
+		before = fence
+	end
+	return lines, before, fence
+end
+
+-- Buffer lines standing in for file lines [head, tail)
+local function gap_lines(state, head_fence, tail_fence)
+	local lines = {}
+	if head_fence then
+		table.insert(lines, "```")
+	end
+	table.insert(
+		lines,
+		string.format("⋯ lines %d-%d load as you scroll here ⋯", state.head + 1, state.tail)
+	)
+	if tail_fence then
+		table.insert(lines, tail_fence)
+	end
+	return lines
+end
+
+local function set_lines(buf, first, last, lines)
+	vim.api.nvim_buf_set_option(buf, "modifiable", true)
+	vim.api.nvim_buf_set_lines(buf, first, last, false, lines)
+	vim.api.nvim_buf_set_option(buf, "modifiable", false)
+end
+
+-- Reads the page after the head into the gap
+local function load_next_page(buf)
+	local state = pages[buf]
+	local last = math.min(state.head + Config.options.preview.page_lines, state.tail)
+	local lines, _, fence = read_lines(state.path, state.index, state.head, last)
+	local first_row = state.head
+	state.head = state.head + #lines
+	if #lines == 0 or state.head >= state.tail then
+		-- Head and tail meet: the gap (with its fence lines) goes away
+		state.head = state.tail
+		set_lines(buf, first_row, first_row + state.gap, lines)
+		state.gap = 0
+		return
+	end
+	local _, tail_fence = read_lines(state.path, state.index, state.tail, state.tail)
+	local gap = gap_lines(state, fence, tail_fence)
+	set_lines(buf, first_row, first_row + state.gap, vim.list_extend(lines, gap))
+	state.gap = #gap
+end
+
+local function on_view_change(buf)
+	local state = pages[buf]
+	if not state or state.gap == 0 then
+		return
+	end
+	for _, win in ipairs(vim.fn.win_findbuf(buf)) do
+		local top = vim.fn.line("w0", win) - 1
+		local bottom = vim.fn.line("w$", win) - 1
+		-- The view is only updated on redraw; the cursor is always current
+		local row = vim.api.nvim_win_get_cursor(win)[1] - 1
+		top, bottom = math.min(top, row), math.max(bottom, row)
+		if state.head <= bottom and state.head + state.gap > top then
+			load_next_page(buf)
+			return
+		end
+	end
+end
+
+vim.api.nvim_create_autocmd("WinScrolled", {
+	group = group,
+	callback = function()
+		for buf in pairs(pages) do
+			on_view_change(buf)
+		end
+	end,
+})
+
+-- Creates a buffer showing the first and last pages of the file at path
+function M.create_buffer(path, index)
+	local page = Config.options.preview.page_lines
+	-- A hidden buffer of an earlier run would hold the name
+	for old, state in pairs(pages) do
+		if state.path == path and #vim.fn.win_findbuf(old) == 0 then
+			vim.api.nvim_buf_delete(old, { force = true })
+		end
+	end
+	local buf = vim.api.nvim_create_buf(false, true)
+	-- Named after the file so relative image links still resolve
+	pcall(vim.api.nvim_buf_set_name, buf, path .. ".paged")
+	vim.api.nvim_buf_set_option(buf, "buftype", "nofile")
+	vim.api.nvim_buf_set_option(buf, "bufhidden", "hide")
+
+	local state = {
+		path = path,
+		index = index,
+		head = 0,
+		tail = math.max(index.lines - page, 0),
+		gap = 0,
+	}
+	local head, _, head_fence = read_lines(path, index, 0, math.min(page, index.lines))
+	state.head = #head
+	if state.head >= state.tail then
+		-- Head and tail pages overlap: the rest of the file is one page, no gap
+		local rest = read_lines(path, index, state.head, index.lines)
+		state.head, state.tail = index.lines, index.lines
+		set_lines(buf, 0, -1, vim.list_extend(head, rest))
+	else
+		local tail, tail_fence = read_lines(path, index, state.tail, index.lines)
+		local gap = gap_lines(state, head_fence, tail_fence)
+		state.gap = #gap
+		set_lines(buf, 0, -1, vim.list_extend(vim.list_extend(head, gap), tail))
+	end
+	pages[buf] = state
+
+	vim.api.nvim_create_autocmd("CursorMoved", {
+		group = group,
+		buffer = buf,
+		callback = function()
+			on_view_change(buf)
+		end,
+	})
+	vim.api.nvim_create_autocmd("BufWipeout", {
+		group = group,
+		buffer = buf,
+		callback = function()
+			pages[buf] = nil
+		end,
+	})
+	return buf
+end
+
+return M
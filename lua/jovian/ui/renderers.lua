@@ -60,22 +60,41 @@ function M.render_variables_pane(vars)
 		end
 	end
 
+	-- Patch only the span that differs from what the pane already shows
+	local old_lines = vim.api.nvim_buf_get_lines(buf, 0, -1, false)
+	local first = 1
+	while first <= #old_lines and first <= #fmt_lines and old_lines[first] == fmt_lines[first] do
+		first = first + 1
+	end
+	local old_last, new_last = #old_lines, #fmt_lines
+	while old_last >= first and new_last >= first and old_lines[old_last] == fmt_lines[new_last] do
+		old_last = old_last - 1
+		new_last = new_last - 1
+	end
+	if first > old_last and first > new_last then
+		return
+	end
+
 	vim.api.nvim_buf_set_option(buf, "readonly", false)
 	vim.api.nvim_buf_set_option(buf, "modifiable", true)
-	vim.api.nvim_buf_set_lines(buf, 0, -1, false, fmt_lines)
+	vim.api.nvim_buf_set_lines(buf, first - 1, old_last, false, vim.list_slice(fmt_lines, first, new_last))
 	vim.api.nvim_buf_set_option(buf, "modifiable", false)
 	vim.api.nvim_buf_set_option(buf, "readonly", true)
 
-	-- Simple highlighting
-	vim.api.nvim_buf_add_highlight(buf, -1, "JovianHeader", 0, 0, -1)
-	vim.api.nvim_buf_add_highlight(buf, -1, "JovianSeparator", 1, 0, -1)
+	-- Simple highlighting (replaced lines lose theirs, the rest keep it)
+	if first == 1 then
+		vim.api.nvim_buf_add_highlight(buf, -1, "JovianHeader", 0, 0, -1)
+	end
+	if first <= 2 and new_last >= 2 then
+		vim.api.nvim_buf_add_highlight(buf, -1, "JovianSeparator", 1, 0, -1)
+	end
 
 	-- Add column highlighting
 	local sep_len = #SEPARATOR
 	local col1_end = sep_len_name
 	local col2_end = col1_end + sep_len + sep_len_type
 
-	for i = 2, #fmt_lines - 1 do
+	for i = math.max(2, first - 1), new_last - 1 do
 		if #vars > 0 then
 			vim.api.nvim_buf_add_highlight(buf, -1, "JovianVariable", i, 0, col1_end)
 			vim.api.nvim_buf_add_highlight(buf, -1, "JovianType", i, col1_end + sep_len, col2_end)
@@ -226,12 +245,75 @@ function M.show_variables(vars, force_float)
 	vim.api.nvim_buf_set_keymap(buf, "n", "<Esc>", ":close<CR>", opts)
 end
 
-function M.show_profile_stats(text)
+-- Profile float: sampled time per cell line, then cProfile rows in the chosen order
+local PROFILE_SORTS = {
+	c = { key = "cumtime", label = "cumulative" },
+	t = { key = "tottime", label = "total" },
+	n = { key = "ncalls", label = "calls" },
+}
+
+local function profile_function_name(row)
+	if row.file == "~" then
+		return row.func -- Builtins have no location
+	elseif row.file == "<cell>" then
+		return string.format("%s (cell line %d)", row.func, row.line)
+	end
+	return string.format("%s (%s:%d)", row.func, vim.fn.fnamemodify(row.file, ":t"), row.line)
+end
+
+local function profile_lines(data, sort)
+	local lines = {}
+	table.insert(
+		lines,
+		string.format("Wall %.3fs  |  %d calls  |  sort: %s (c/t/n)", data.wall, data.total_calls, PROFILE_SORTS[sort].label)
+	)
+	if data.path then
+		table.insert(lines, "Saved: " .. data.path)
+	end
+
+	if data.lines and #data.lines > 0 then
+		table.insert(lines, "")
+		table.insert(lines, string.format("Cell lines (sampled every %d ms)", math.floor(data.interval * 1000 + 0.5)))
+		table.insert(lines, string.format("%6s %9s %7s  %s", "Line", "Time", "%", "Code"))
+		for _, l in ipairs(data.lines) do
+			local code = vim.trim((data.code or {})[l.line] or "")
+			table.insert(lines, string.format("%6d %8.3fs %6.1f%%  %s", l.line, l.time, l.percent, code))
+		end
+	end
+
+	table.insert(lines, "")
+	table.insert(lines, "Functions")
+	table.insert(lines, string.format("%10s %10s %10s  %s", "ncalls", "tottime", "cumtime", "function"))
+	local key = PROFILE_SORTS[sort].key
+	local rows = vim.list_extend({}, data.rows or {})
+	table.sort(rows, function(a, b)
+		return a[key] > b[key]
+	end)
+	for _, row in ipairs(rows) do
+		-- "total/primitive" for recursive functions, like pstats
+		local calls = tostring(row.ncalls)
+		if row.primcalls ~= row.ncalls then
+			calls = calls .. "/" .. row.primcalls
+		end
+		table.insert(
+			lines,
+			string.format("%10s %10.4f %10.4f  %s", calls, row.tottime, row.cumtime, profile_function_name(row))
+		)
+	end
+	return lines
+end
+
+function M.show_profile_stats(data)
 	local buf = vim.api.nvim_create_buf(false, true)
 	vim.api.nvim_buf_set_option(buf, "bufhidden", "wipe")
 
-	local lines = vim.split(text, "\n")
-	vim.api.nvim_buf_set_lines(buf, 0, -1, false, lines)
+	local sort = "c"
+	local function render()
+		vim.api.nvim_buf_set_option(buf, "modifiable", true)
+		vim.api.nvim_buf_set_lines(buf, 0, -1, false, profile_lines(data, sort))
+		vim.api.nvim_buf_set_option(buf, "modifiable", false)
+	end
+	render()
 
 	local width = math.floor(vim.o.columns * 0.8)
 	local height = math.floor(vim.o.lines * 0.8)
@@ -246,10 +328,11 @@ function M.show_profile_stats(text)
 		col = col,
 		style = "minimal",
 		border = Config.options.float_border,
-		title = " cProfile Stats ",
-		title_pos = "center",
+		title = " Profile: " .. (data.cell_id or "cell") .. " ",
 		title_pos = "center",
 	})
+	vim.wo[win].wrap = false
+	vim.wo[win].cursorline = true
 	if Config.options.ui.winblend then
 		vim.wo[win].winblend = Config.options.ui.winblend
 	end
@@ -257,13 +340,138 @@ function M.show_profile_stats(text)
 	local opts = { noremap = true, silent = true }
 	vim.api.nvim_buf_set_keymap(buf, "n", "q", ":close<CR>", opts)
 	vim.api.nvim_buf_set_keymap(buf, "n", "<Esc>", ":close<CR>", opts)
+	for lhs, _ in pairs(PROFILE_SORTS) do
+		vim.keymap.set("n", lhs, function()
+			sort = lhs
+			render()
+		end, { buffer = buf, nowait = true, silent = true })
+	end
 end
 
-function M.show_dataframe(data)
-	local buf = vim.api.nvim_create_buf(false, true)
-	vim.api.nvim_buf_set_option(buf, "bufhidden", "wipe")
-	local SEPARATOR = " │ "
-	local PADDING = 1
+-- DataFrame viewer: each float shows one page of a view the kernel keeps open
+local DF_SEPARATOR = " │ "
+local DF_PADDING = 1
+
+local function dataframe_status(view)
+	local first = view.rows > 0 and view.offset + 1 or 0
+	local last = math.min(view.offset + view.limit, view.rows)
+	local rows = string.format("rows %d-%d of %d", first, last, view.rows)
+	if view.rows ~= view.total_rows then
+		rows = rows .. " (filtered from " .. view.total_rows .. ")"
+	end
+	local parts = { rows }
+	if view.n_cols > view.col_limit then
+		local last_col = math.min(view.col_offset + view.col_limit, view.n_cols)
+		table.insert(parts, string.format("cols %d-%d of %d", view.col_offset + 1, last_col, view.n_cols))
+	end
+	if view.sort then
+		table.insert(parts, "sort: " .. view.sort_column .. (view.sort.ascending and " ↑" or " ↓"))
+	end
+	if view.filter ~= "" then
+		table.insert(parts, "filter: " .. view.filter)
+	end
+	return " " .. table.concat(parts, DF_SEPARATOR)
+end
+
+-- Absolute (0-based) position of the data column under the cursor
+local function dataframe_column_at_cursor(view)
+	local vcol = vim.fn.virtcol(".") - 1
+	local pos = 0
+	for j, w in ipairs(view.col_widths) do
+		pos = pos + w + (DF_PADDING * 2)
+		if vcol < pos then
+			return j > 1 and view.col_offset + j - 2 or nil
+		end
+		pos = pos + vim.fn.strdisplaywidth(DF_SEPARATOR)
+	end
+	return nil
+end
+
+local function dataframe_keymaps(view)
+	local Core = require("jovian.core")
+	local function map(lhs, fn)
+		vim.keymap.set("n", lhs, fn, { buffer = view.buf, nowait = true, silent = true })
+	end
+	local function page(changes)
+		Core.dataframe_page(view, changes)
+	end
+
+	map("<C-f>", function()
+		if view.offset + view.limit < view.rows then
+			page({ offset = view.offset + view.limit })
+		end
+	end)
+	map("<C-b>", function()
+		if view.offset > 0 then
+			page({ offset = math.max(view.offset - view.limit, 0) })
+		end
+	end)
+	map("gg", function()
+		page({ offset = 0 })
+	end)
+	map("G", function()
+		page({ offset = math.max(view.rows - view.limit, 0) })
+	end)
+	map(">", function()
+		if view.col_offset + view.col_limit < view.n_cols then
+			page({ col_offset = view.col_offset + view.col_limit })
+		end
+	end)
+	map("<", function()
+		if view.col_offset > 0 then
+			page({ col_offset = math.max(view.col_offset - view.col_limit, 0) })
+		end
+	end)
+	-- Ascending -> descending -> unsorted
+	map("s", function()
+		local column = dataframe_column_at_cursor(view)
+		if not column then
+			return
+		end
+		local sort = { column = column, ascending = true }
+		if view.sort and view.sort.column == column then
+			sort = view.sort.ascending and { column = column, ascending = false } or false
+		end
+		page({ sort = sort, offset = 0 })
+	end)
+	map("f", function()
+		vim.ui.input({ prompt = "Filter (DataFrame.query): ", default = view.filter }, function(input)
+			if input then
+				page({ filter = input, offset = 0 })
+			end
+		end)
+	end)
+	map("q", "<cmd>close<CR>")
+	map("<Esc>", "<cmd>close<CR>")
+
+	-- Release the kernel's handle on the frame with the float
+	vim.api.nvim_create_autocmd("BufWipeout", {
+		buffer = view.buf,
+		once = true,
+		callback = function()
+			Core.dataframe_close(view.view_id)
+		end,
+	})
+end
+
+function M.show_dataframe(data, open)
+	local view = State.dataframe_views[data.view_id]
+	if not view then
+		-- A late page for a view that was already closed
+		if not open or not data.view_id then
+			return
+		end
+		view = { view_id = data.view_id, name = data.name }
+		State.dataframe_views[data.view_id] = view
+	end
+
+	-- Take the window the kernel actually served
+	for _, key in ipairs({ "offset", "limit", "rows", "total_rows", "col_offset", "col_limit", "n_cols" }) do
+		view[key] = data[key]
+	end
+	view.sort = data.sort ~= vim.NIL and data.sort or false
+	view.sort_column = data.sort_column ~= vim.NIL and data.sort_column or ""
+	view.filter = data.filter ~= vim.NIL and data.filter or ""
 
 	local headers = { "" }
 	for _, c in ipairs(data.columns) do
@@ -283,47 +491,58 @@ function M.show_dataframe(data)
 			col_widths[j + 1] = math.max(col_widths[j + 1] or 0, vim.fn.strdisplaywidth(s))
 		end
 	end
+	view.col_widths = col_widths
 
 	local function pad_str(s, w)
 		local vis_w = vim.fn.strdisplaywidth(s)
-		return string.rep(" ", PADDING) .. s .. string.rep(" ", w - vis_w + PADDING)
+		return string.rep(" ", DF_PADDING) .. s .. string.rep(" ", w - vis_w + DF_PADDING)
 	end
 
-	local fmt_lines = {}
+	local fmt_lines = { dataframe_status(view) }
 	local header_line = ""
 	for i, h in ipairs(headers) do
-		header_line = header_line .. pad_str(h, col_widths[i]) .. (i < #headers and SEPARATOR or "")
+		header_line = header_line .. pad_str(h, col_widths[i]) .. (i < #headers and DF_SEPARATOR or "")
 	end
 	table.insert(fmt_lines, header_line)
 
 	local sep_line = ""
 	for i, w in ipairs(col_widths) do
-		local total_w = w + (PADDING * 2)
+		local total_w = w + (DF_PADDING * 2)
 		sep_line = sep_line .. string.rep("─", total_w) .. (i < #headers and "─┼─" or "")
 	end
 	table.insert(fmt_lines, sep_line)
 
 	for i, row in ipairs(data.data) do
-		local line_str = pad_str(tostring(data.index[i]), col_widths[1]) .. SEPARATOR
+		local line_str = pad_str(tostring(data.index[i]), col_widths[1]) .. DF_SEPARATOR
 		for j, val in ipairs(row) do
-			line_str = line_str .. pad_str(tostring(val), col_widths[j + 1]) .. (j < #row and SEPARATOR or "")
+			line_str = line_str .. pad_str(tostring(val), col_widths[j + 1]) .. (j < #row and DF_SEPARATOR or "")
 		end
 		table.insert(fmt_lines, line_str)
 	end
 
+	local new_buf = not (view.buf and vim.api.nvim_buf_is_valid(view.buf))
+	if new_buf then
+		view.buf = vim.api.nvim_create_buf(false, true)
+		vim.api.nvim_buf_set_option(view.buf, "bufhidden", "wipe")
+	end
+	local buf = view.buf
+
+	vim.api.nvim_buf_set_option(buf, "modifiable", true)
 	vim.api.nvim_buf_set_lines(buf, 0, -1, false, fmt_lines)
-	vim.api.nvim_buf_add_highlight(buf, -1, "JovianHeader", 0, 0, -1)
-	vim.api.nvim_buf_add_highlight(buf, -1, "JovianSeparator", 1, 0, -1)
+	vim.api.nvim_buf_set_option(buf, "modifiable", false)
+	vim.api.nvim_buf_add_highlight(buf, -1, "Comment", 0, 0, -1)
+	vim.api.nvim_buf_add_highlight(buf, -1, "JovianHeader", 1, 0, -1)
+	vim.api.nvim_buf_add_highlight(buf, -1, "JovianSeparator", 2, 0, -1)
 
-	local index_col_width = col_widths[1] + (PADDING * 2)
-	for i = 2, #fmt_lines - 1 do
+	local index_col_width = col_widths[1] + (DF_PADDING * 2)
+	for i = 3, #fmt_lines - 1 do
 		vim.api.nvim_buf_add_highlight(buf, -1, "JovianIndex", i, 0, index_col_width)
 		local current_pos = 0
 		for j, w in ipairs(col_widths) do
-			current_pos = current_pos + w + (PADDING * 2)
+			current_pos = current_pos + w + (DF_PADDING * 2)
 			if j < #col_widths then
-				vim.api.nvim_buf_add_highlight(buf, -1, "JovianSeparator", i, current_pos, current_pos + #SEPARATOR)
-				current_pos = current_pos + #SEPARATOR
+				vim.api.nvim_buf_add_highlight(buf, -1, "JovianSeparator", i, current_pos, current_pos + #DF_SEPARATOR)
+				current_pos = current_pos + #DF_SEPARATOR
 			end
 		end
 	end
@@ -336,28 +555,35 @@ function M.show_dataframe(data)
 
 	local width = math.min(content_width, math.floor(vim.o.columns * 0.9))
 	local height = math.min(#fmt_lines, math.floor(vim.o.lines * 0.8))
-	local row = math.floor((vim.o.lines - height) / 2)
-	local col = math.floor((vim.o.columns - width) / 2)
-	local win = vim.api.nvim_open_win(buf, true, {
+	local win_config = {
 		relative = "editor",
 		width = width,
 		height = height,
-		row = row,
-		col = col,
-		style = "minimal",
-		border = Config.options.float_border,
-		title = " " .. data.name .. " ",
-		title_pos = "center",
-	})
+		row = math.floor((vim.o.lines - height) / 2),
+		col = math.floor((vim.o.columns - width) / 2),
+	}
+
+	if view.win and vim.api.nvim_win_is_valid(view.win) then
+		vim.api.nvim_win_set_config(view.win, win_config)
+		vim.api.nvim_win_set_cursor(view.win, { math.min(4, #fmt_lines), 0 })
+		return
+	end
+
+	win_config.style = "minimal"
+	win_config.border = Config.options.float_border
+	win_config.title = " " .. data.name .. " "
+	win_config.title_pos = "center"
+	local win = vim.api.nvim_open_win(buf, true, win_config)
+	view.win = win
 	vim.wo[win].wrap = false
 	vim.wo[win].cursorline = true
 	if Config.options.ui.winblend then
 		vim.wo[win].winblend = Config.options.ui.winblend
 	end
 	vim.wo[win].winhighlight = "NormalFloat:JovianFloat,FloatBorder:JovianFloatBorder"
-	local opts = { noremap = true, silent = true }
-	vim.api.nvim_buf_set_keymap(buf, "n", "q", ":close<CR>", opts)
-	vim.api.nvim_buf_set_keymap(buf, "n", "<Esc>", ":close<CR>", opts)
+	if new_buf then
+		dataframe_keymaps(view)
+	end
 end
 
 function M.show_inspection(data)
@@ -437,6 +663,40 @@ function M.show_peek(data)
 	if data.shape and data.shape ~= "" then
 		table.insert(lines, "Shape: " .. data.shape)
 	end
+	if data.dtype then
+		table.insert(lines, "DType: " .. data.dtype)
+	end
+	if data.nulls then
+		table.insert(lines, "Nulls: " .. data.nulls)
+	end
+
+	-- Summary statistics (computed on a sample for large values)
+	local function fmt_num(v)
+		return type(v) == "number" and string.format("%.6g", v) or tostring(v)
+	end
+	local function fmt_stats(s)
+		if s.min == nil or s.min == vim.NIL then
+			return ""
+		end
+		return "min=" .. fmt_num(s.min) .. " max=" .. fmt_num(s.max) .. " mean=" .. fmt_num(s.mean)
+	end
+	local sampled = data.sampled and " (sampled)" or ""
+	if data.stats and data.stats ~= vim.NIL then
+		table.insert(lines, "Stats: " .. fmt_stats(data.stats) .. sampled)
+	end
+	if data.columns then
+		table.insert(lines, "")
+		table.insert(lines, "Columns:" .. sampled)
+		for _, c in ipairs(data.columns) do
+			local line = "  " .. c.name .. "  " .. c.dtype .. "  nulls=" .. tostring(c.nulls)
+			local stats = fmt_stats(c)
+			if stats ~= "" then
+				line = line .. "  " .. stats
+			end
+			table.insert(lines, line)
+		end
+	end
+
 	table.insert(lines, "")
 	table.insert(lines, "Value:")
 	for _, l in ipairs(vim.split(data.repr, "\n")) do
@@ -26,6 +26,19 @@ function M.send_notification(msg, level)
 	end
 end
 
+-- Opens a file in the system viewer (vim.ui.open needs Neovim 0.10)
+function M.open_file(path)
+	if vim.ui.open then
+		vim.ui.open(path)
+	elseif vim.fn.executable("xdg-open") == 1 then
+		vim.fn.jobstart({ "xdg-open", path }, { detach = true })
+	elseif vim.fn.executable("open") == 1 then
+		vim.fn.jobstart({ "open", path }, { detach = true })
+	else
+		vim.notify("Jovian: no viewer to open " .. path, vim.log.levels.WARN)
+	end
+end
+
 function M.append_to_repl(text, hl_group)
 	if not State.term_chan then
 		return
@@ -95,25 +108,22 @@ function M.append_to_repl(text, hl_group)
 	end
 end
 
-function M.append_stream_text(text, stream_type)
-	if not State.term_chan then
-		return
+local function ends_with_newline(str)
+	if not str or str == "" then
+		return false
 	end
+	-- Strip ANSI codes (simple approximation for CSI codes)
+	local stripped = str:gsub("\27%[[0-9;]*m", "")
+	-- Only consider \n as newline. \r means cursor is at start of line,
+	-- so we need to inject \n to preserve the line content.
+	return stripped:sub(-1) == "\n"
+end
 
+-- Converts one stream chunk into terminal output, tracking the last stream state
+local function format_stream_text(text, stream_type)
 	-- nvim_open_term handles \r and \n automatically,
 	-- so just send it as is!
 
-	local function ends_with_newline(str)
-		if not str or str == "" then
-			return false
-		end
-		-- Strip ANSI codes (simple approximation for CSI codes)
-		local stripped = str:gsub("\27%[[0-9;]*m", "")
-		-- Only consider \n as newline. \r means cursor is at start of line,
-		-- so we need to inject \n to preserve the line content.
-		return stripped:sub(-1) == "\n"
-	end
-
 	-- Fix for tqdm: If switching from stderr (no newline) to stdout, inject newline
 	if stream_type == "stdout" and State.last_stream_type == "stderr" then
 		if not ends_with_newline(State.last_stream_tail) then
@@ -141,14 +151,18 @@ function M.append_stream_text(text, stream_type)
 		clean_text = RED .. clean_text .. RESET
 	end
 
-	local ok, err = pcall(vim.api.nvim_chan_send, State.term_chan, clean_text)
+	return clean_text
+end
+
+local function send_to_term(output)
+	local ok, err = pcall(vim.api.nvim_chan_send, State.term_chan, output)
 	if not ok then
 		if string.match(err, "E900") then
 			-- Invalid channel, try to recover if buffer exists
 			if State.buf.output and vim.api.nvim_buf_is_valid(State.buf.output) then
 				State.term_chan = vim.api.nvim_open_term(State.buf.output, {})
 				-- Retry send
-				pcall(vim.api.nvim_chan_send, State.term_chan, clean_text)
+				pcall(vim.api.nvim_chan_send, State.term_chan, output)
 			end
 		else
 			-- Re-raise other errors
@@ -163,4 +177,24 @@ function M.append_stream_text(text, stream_type)
 	end
 end
 
+function M.append_stream_text(text, stream_type)
+	if not State.term_chan then
+		return
+	end
+	send_to_term(format_stream_text(text, stream_type))
+end
+
+-- Batched stream output from the backend: one terminal write and scroll per batch
+function M.append_stream_batch(chunks)
+	if not State.term_chan or not chunks then
+		return
+	end
+
+	local parts = {}
+	for _, chunk in ipairs(chunks) do
+		parts[#parts + 1] = format_stream_text(chunk.text or "", chunk.stream)
+	end
+	send_to_term(table.concat(parts))
+end
+
 return M
@@ -3,6 +3,7 @@ local Config = require("jovian.config")
 local State = require("jovian.state")
 local Shared = require("jovian.ui.shared")
 local Renderers = require("jovian.ui.renderers")
+local Pager = require("jovian.ui.pager")
 
 function M.get_or_create_buf(name)
 	local existing = vim.fn.bufnr(name)
@@ -21,8 +22,50 @@ function M.get_or_create_buf(name)
 	return buf
 end
 
+-- Output buffers shown recently, least recently used first:
+-- { path, buf, stamp } where stamp identifies the file version it holds
+local recent = {}
+
+local function find_recent(key, value)
+	for i, entry in ipairs(recent) do
+		if entry[key] == value then
+			return i, entry
+		end
+	end
+end
+
+-- Drops the oldest hidden buffers past preview.cache_buffers/cache_bytes;
+-- the newest (about to be shown) always stays
+local function evict_recent()
+	local opts = Config.options.preview
+	local total = 0
+	for i = #recent, 1, -1 do
+		local buf = recent[i].buf
+		if vim.api.nvim_buf_is_valid(buf) then
+			total = total + vim.api.nvim_buf_get_offset(buf, vim.api.nvim_buf_line_count(buf))
+		else
+			table.remove(recent, i)
+		end
+	end
+	local i = 1
+	while i < #recent and (#recent > opts.cache_buffers or total > opts.cache_bytes) do
+		local buf = recent[i].buf
+		if #vim.fn.win_findbuf(buf) > 0 then
+			i = i + 1
+		else
+			total = total - vim.api.nvim_buf_get_offset(buf, vim.api.nvim_buf_line_count(buf))
+			table.remove(recent, i)
+			vim.api.nvim_buf_delete(buf, { force = true })
+		end
+	end
+end
+
 -- Helper to cleanup old buffer if not used elsewhere
 local function cleanup_buffer(old_buf, current_buf)
+	-- Cached output buffers stay until evicted
+	if find_recent("buf", old_buf) then
+		return
+	end
 	if old_buf and old_buf ~= current_buf and vim.api.nvim_buf_is_valid(old_buf) then
 		-- Safety Check 1: Do not delete modified buffers
 		if vim.api.nvim_buf_get_option(old_buf, "modified") then
@@ -90,21 +133,21 @@ function M.close_windows()
 	State.win.pin = nil
 end
 
-function M.open_markdown_preview(filepath)
-	if not (State.win.preview and vim.api.nvim_win_is_valid(State.win.preview)) then
-		return
+-- Buffer showing a cell's markdown output; large outputs (with a .md.idx)
+-- get a paged buffer so only the pages in view are read and highlighted
+local function create_output_buffer(abs_filepath)
+	local index = Pager.read_index(abs_filepath)
+	if index and index.lines > Config.options.preview.max_lines then
+		local buf = Pager.create_buffer(abs_filepath, index)
+		vim.api.nvim_buf_set_option(buf, "filetype", "markdown")
+		vim.api.nvim_buf_set_option(buf, "modifiable", false)
+		return buf
 	end
 
-	-- Capture the old buffer *before* switching
-	local old_buf = vim.api.nvim_win_get_buf(State.win.preview)
-
-	local abs_filepath = vim.fn.fnamemodify(filepath, ":p")
-	State.current_preview_file = abs_filepath
-
 	-- Use bufadd to create/get buffer without switching windows
 	local buf = vim.fn.bufadd(abs_filepath)
 	if buf == 0 then
-		return
+		return nil
 	end -- Failed
 
 	-- Load the buffer if not loaded
@@ -115,15 +158,62 @@ function M.open_markdown_preview(filepath)
 		vim.cmd("checktime " .. buf)
 	end
 
-	-- Set buffer to preview window
-	vim.api.nvim_win_set_buf(State.win.preview, buf)
-
 	-- Set read-only and non-modifiable
 	vim.api.nvim_buf_set_option(buf, "filetype", "markdown")
 	-- Keep buftype empty (normal file) but set readonly
 	vim.api.nvim_buf_set_option(buf, "buftype", "")
 	vim.api.nvim_buf_set_option(buf, "modifiable", false)
 	vim.api.nvim_buf_set_option(buf, "readonly", true)
+	return buf
+end
+
+-- Revisiting an unchanged output swaps in its cached buffer, already
+-- loaded and highlighted
+local function load_output_buffer(abs_filepath)
+	local stat = vim.loop.fs_stat(abs_filepath)
+	local stamp = stat and string.format("%d.%d:%d", stat.mtime.sec, stat.mtime.nsec, stat.size)
+	local i, entry = find_recent("path", abs_filepath)
+	if entry then
+		table.remove(recent, i)
+		if stamp and entry.stamp == stamp and vim.api.nvim_buf_is_valid(entry.buf) then
+			table.insert(recent, entry)
+			return entry.buf
+		end
+	end
+
+	local buf = create_output_buffer(abs_filepath)
+	if not buf then
+		return nil
+	end
+	-- Keep it loaded once it leaves the window
+	vim.api.nvim_buf_set_option(buf, "bufhidden", "hide")
+	if entry and entry.buf ~= buf and vim.api.nvim_buf_is_valid(entry.buf) and #vim.fn.win_findbuf(entry.buf) == 0 then
+		-- A paged buffer of the previous version
+		vim.api.nvim_buf_delete(entry.buf, { force = true })
+	end
+	table.insert(recent, { path = abs_filepath, buf = buf, stamp = stamp })
+	evict_recent()
+	return buf
+end
+
+function M.open_markdown_preview(filepath)
+	if not (State.win.preview and vim.api.nvim_win_is_valid(State.win.preview)) then
+		return
+	end
+
+	-- Capture the old buffer *before* switching
+	local old_buf = vim.api.nvim_win_get_buf(State.win.preview)
+
+	local abs_filepath = vim.fn.fnamemodify(filepath, ":p")
+	State.current_preview_file = abs_filepath
+
+	local buf = load_output_buffer(abs_filepath)
+	if not buf then
+		return
+	end
+
+	-- Set buffer to preview window
+	vim.api.nvim_win_set_buf(State.win.preview, buf)
 
 	M.apply_window_options(State.win.preview, { wrap = true })
 
@@ -144,24 +234,13 @@ function M.pin_cell(filepath)
 	local old_buf = vim.api.nvim_win_get_buf(State.win.pin)
 
 	-- Create/Get buffer
-	local buf = vim.fn.bufadd(abs_filepath)
-	if buf == 0 then
+	local buf = load_output_buffer(abs_filepath)
+	if not buf then
 		return
 	end
 
-	if not vim.api.nvim_buf_is_loaded(buf) then
-		vim.fn.bufload(buf)
-	else
-		vim.cmd("checktime " .. buf)
-	end
-
 	vim.api.nvim_win_set_buf(State.win.pin, buf)
 
-	vim.api.nvim_buf_set_option(buf, "filetype", "markdown")
-	vim.api.nvim_buf_set_option(buf, "buftype", "")
-	vim.api.nvim_buf_set_option(buf, "modifiable", false)
-	vim.api.nvim_buf_set_option(buf, "readonly", true)
-
 	-- Cleanup old buffer
 	cleanup_buffer(old_buf, buf)
 end
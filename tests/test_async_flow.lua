@@ -110,28 +110,24 @@ Hosts.validate_connection({ type = "ssh", host = "myserver", python = "python3"
     end
 )
 
--- Should have started SSH check
+-- Connectivity and remote Python are checked by a single ssh job
 local ssh_check_job = #PendingJobs
-if PendingJobs[ssh_check_job].cmd[1] == "ssh" then
-    print("PASS: SSH check started")
+local ssh_cmd = PendingJobs[ssh_check_job].cmd
+if ssh_cmd[1] == "ssh" and vim.tbl_contains(ssh_cmd, "myserver") and vim.tbl_contains(ssh_cmd, "python3") then
+    print("PASS: SSH and remote Python check started")
 else
-    print("FAIL: Expected SSH check, got " .. vim.inspect(PendingJobs[ssh_check_job].cmd))
+    print("FAIL: Expected SSH check, got " .. vim.inspect(ssh_cmd))
 end
 
 -- Complete SSH check
 complete_job(ssh_check_job, 0)
 
--- Should now have started Python check
-local py_check_job = #PendingJobs
-if py_check_job > ssh_check_job and PendingJobs[py_check_job].cmd[3] == "python3" then
-    print("PASS: Remote Python check started")
+if #PendingJobs == ssh_check_job then
+    print("PASS: No extra round trip")
 else
-    print("FAIL: Expected Remote Python check")
+    print("FAIL: Unexpected job " .. vim.inspect(PendingJobs[#PendingJobs].cmd))
 end
 
--- Complete Python check
-complete_job(py_check_job, 0)
-
 if t2_done then
     print("PASS: SSH Validation completed successfully")
 else
@@ -151,27 +147,17 @@ Core.sync_backend("myserver", "/local/backend",
     end
 )
 
--- Should have started 'ssh rm'
-local rm_job = #PendingJobs
-if string.match(PendingJobs[rm_job].cmd, "rm %-rf") then
-    print("PASS: Remote cleanup started")
-else
-    print("FAIL: Expected rm -rf, got " .. PendingJobs[rm_job].cmd)
-end
-
--- Complete cleanup
-complete_job(rm_job, 0)
-
--- Should have started 'scp'
-local scp_job = #PendingJobs
-if scp_job > rm_job and string.match(PendingJobs[scp_job].cmd, "scp %-r") then
-    print("PASS: SCP started")
+-- Hash check and upload share one ssh round trip
+local sync_job = #PendingJobs
+local sync_cmd = PendingJobs[sync_job].cmd
+if string.match(sync_cmd, "^tar ") and string.match(sync_cmd, "| 'ssh'") and string.match(sync_cmd, "myserver") then
+    print("PASS: Backend upload started")
 else
-    print("FAIL: Expected SCP")
+    print("FAIL: Expected tar | ssh, got " .. sync_cmd)
 end
 
--- Complete SCP
-complete_job(scp_job, 0)
+-- Complete upload
+complete_job(sync_job, 0)
 
 if t3_done then
     print("PASS: Backend Sync completed successfully")
@@ -0,0 +1,101 @@
+-- test_pager.lua
+-- Verifies that a paged preview shows the first and last pages and reads the rest as it scrolls.
+
+-- 1. Setup package path
+local script_path = debug.getinfo(1).source:sub(2)
+local project_root = vim.fn.fnamemodify(script_path, ":p:h:h")
+package.path = package.path .. ";" .. project_root .. "/lua/?.lua" .. ";" .. project_root .. "/lua/?/init.lua"
+
+local Config = require("jovian.config")
+Config.setup({ preview = { max_lines = 2000, page_lines = 500 } })
+package.loaded["jovian.ui.pager"] = nil
+local Pager = require("jovian.ui.pager")
+
+-- Same layout as markdown_index() in kernel_bridge.py
+local function write_output(path, lines)
+	local step = 256
+	local offsets, fences = {}, {}
+	local pos, fence = 0, vim.NIL
+	for i, line in ipairs(lines) do
+		if (i - 1) % step == 0 then
+			table.insert(offsets, pos)
+			table.insert(fences, fence)
+		end
+		pos = pos + #line + 1
+		if line:match("^```") then
+			fence = fence == vim.NIL and line or vim.NIL
+		end
+	end
+	vim.fn.writefile(lines, path)
+	local index = { lines = #lines, bytes = pos, step = step, offsets = offsets, fences = fences }
+	vim.fn.writefile({ vim.fn.json_encode(index) }, path .. ".idx")
+end
+
+local lines = { "# Output: big", "" }
+for block = 1, 30 do
+	table.insert(lines, "```text")
+	for i = 1, 300 do
+		table.insert(lines, "block " .. block .. " line " .. i)
+	end
+	vim.list_extend(lines, { "```", "" })
+end
+local path = vim.fn.tempname() .. ".md"
+write_output(path, lines)
+
+-- Test 1: Only the first and last pages are loaded
+print("Test 1: Initial pages")
+local index = Pager.read_index(path)
+local buf = Pager.create_buffer(path, index)
+local count = vim.api.nvim_buf_line_count(buf)
+if count < 1100 then
+	print("PASS: " .. count .. " of " .. #lines .. " lines loaded")
+else
+	print("FAIL: " .. count .. " lines loaded")
+end
+
+-- Test 2: Scrolling to the gap loads pages until the whole file is shown
+print("\nTest 2: Scroll through")
+vim.api.nvim_win_set_buf(0, buf)
+for _ = 1, 100 do
+	local gap
+	for i, line in ipairs(vim.api.nvim_buf_get_lines(buf, 0, -1, false)) do
+		if line:find("load as you scroll", 1, true) then
+			gap = i
+			break
+		end
+	end
+	if not gap then
+		break
+	end
+	vim.api.nvim_win_set_cursor(0, { gap, 0 })
+	vim.api.nvim_exec_autocmds("CursorMoved", { buffer = buf })
+end
+if vim.deep_equal(vim.api.nvim_buf_get_lines(buf, 0, -1, false), lines) then
+	print("PASS: Buffer matches the file")
+else
+	print("FAIL: Buffer differs from the file")
+end
+
+-- Test 3: Head and tail pages that overlap load as one page
+print("\nTest 3: Overlapping pages")
+local short = { "# Output: short", "" }
+for i = 1, 998 do
+	table.insert(short, "line " .. i)
+end
+local short_path = vim.fn.tempname() .. ".md"
+write_output(short_path, short)
+local short_buf = Pager.create_buffer(short_path, Pager.read_index(short_path))
+if vim.deep_equal(vim.api.nvim_buf_get_lines(short_buf, 0, -1, false), short) then
+	print("PASS: Whole file shown without a gap")
+else
+	print("FAIL: Buffer differs from the file")
+end
+
+-- Test 4: A stale index is ignored
+print("\nTest 4: Stale index")
+vim.fn.writefile({ "short" }, path, "b")
+if Pager.read_index(path) == nil then
+	print("PASS: Index ignored")
+else
+	print("FAIL: Stale index used")
+end
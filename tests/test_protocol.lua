@@ -0,0 +1,64 @@
+-- test_protocol.lua
+-- Verifies that the bridge output reader handles JSON lines and frames split at any point.
+
+-- 1. Setup package path
+local script_path = debug.getinfo(1).source:sub(2)
+local project_root = vim.fn.fnamemodify(script_path, ":p:h:h")
+package.path = package.path .. ";" .. project_root .. "/lua/?.lua" .. ";" .. project_root .. "/lua/?/init.lua"
+
+package.loaded["jovian.protocol"] = nil
+local Protocol = require("jovian.protocol")
+
+local function frame(msg)
+    local json = vim.fn.json_encode(msg)
+    return "@" .. #json .. ":" .. json
+end
+
+-- Job callbacks receive chunks split on newlines
+local function feed(reader, chunk)
+    return Protocol.feed(reader, vim.split(chunk, "\n", { plain = true }))
+end
+
+local function read_all(stream, step)
+    local reader = Protocol.new_reader()
+    local names = {}
+    for i = 1, #stream, step do
+        for _, msg in ipairs(feed(reader, stream:sub(i, i + step - 1))) do
+            table.insert(names, msg.type or ("raw:" .. msg.raw))
+        end
+    end
+    return names
+end
+
+-- Test 1: JSON lines, stray output and frames in one stream
+print("Test 1: Mixed stream")
+local stream = vim.fn.json_encode({ type = "ready" }) .. "\n"
+    .. "Traceback (most recent call last):\n"
+    .. frame({ type = "protocol", version = 2 })
+    .. frame({ type = "stream", text = "line\nwith newline" })
+    .. frame({ type = "result_ready", file = string.rep("x", 100000) })
+local expected = { "ready", "raw:Traceback (most recent call last):", "protocol", "stream", "result_ready" }
+
+local ok = true
+for _, step in ipairs({ 1, 2, 7, 64, 4096, #stream }) do
+    local names = read_all(stream, step)
+    if not vim.deep_equal(names, expected) then
+        ok = false
+        print("FAIL: chunk size " .. step .. " gave " .. vim.inspect(names))
+    end
+end
+if ok then
+    print("PASS: Messages decoded for every chunk size")
+end
+
+-- Test 2: A frame is only decoded once complete
+print("\nTest 2: Partial frame")
+local reader = Protocol.new_reader()
+local big = frame({ type = "dataframe_data", data = string.rep("y", 50000) })
+local first = feed(reader, big:sub(1, 30000))
+local second = feed(reader, big:sub(30001))
+if #first == 0 and #second == 1 and second[1].type == "dataframe_data" then
+    print("PASS: Frame decoded after its last byte")
+else
+    print("FAIL: Got " .. #first .. " then " .. #second .. " messages")
+end
@@ -0,0 +1,47 @@
+-- test_stale_plan.lua
+-- Verifies which cells :JovianRunStale re-runs, including cells with IPython magics.
+
+-- 1. Setup paths
+local script_path = debug.getinfo(1).source:sub(2)
+local project_root = vim.fn.fnamemodify(script_path, ":p:h:h")
+local backend = project_root .. "/lua/jovian/backend"
+
+-- Runs plan_stale() from kernel_bridge.py on cells given as code strings
+local function plan(codes, stale)
+	local cells = {}
+	for i, code in ipairs(codes) do
+		table.insert(cells, { id = tostring(i), code = code })
+	end
+	local script = table.concat({
+		"import json, sys",
+		"sys.path.insert(0, sys.argv[1])",
+		"import kernel_bridge",
+		"args = json.loads(sys.stdin.read())",
+		"print(json.dumps(kernel_bridge.plan_stale(args['cells'], args['stale'])))",
+	}, "\n")
+	local out = vim.fn.system({ "python3", "-c", script, backend }, vim.fn.json_encode({ cells = cells, stale = stale }))
+	return vim.v.shell_error == 0 and vim.fn.json_decode(out) or out
+end
+
+local function check(name, codes, stale, expected)
+	local got = plan(codes, stale)
+	if vim.deep_equal(got, expected) then
+		print("PASS: " .. name)
+	else
+		print("FAIL: " .. name .. " gave " .. vim.inspect(got))
+	end
+end
+
+-- Test 1: Dependents of a stale cell re-run, independent cells do not
+print("Test 1: Dependencies")
+check("Reader re-runs", { "a = 1", "b = a + 1", "c = 3" }, { "1" }, { "1", "2" })
+
+-- Test 2: Magics that run code are analysed as that code
+print("\nTest 2: Code magics")
+check("%time line", { "a = 1", "%time b = a", "print(b)" }, { "1" }, { "1", "2", "3" })
+check("%%timeit cell", { "y = 1", "%%timeit -n 10\nx = f(y)", "z = 2" }, { "1" }, { "1", "2" })
+
+-- Test 3: Other magics and shell escapes re-run once anything changed
+print("\nTest 3: Opaque magics")
+check("Shell escape", { "var = 1", "!echo {var}", "z = 2" }, { "1" }, { "1", "2" })
+check("Nothing changed", { "var = 1", "!echo {var}" }, {}, {})